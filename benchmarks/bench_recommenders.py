@@ -0,0 +1,321 @@
+"""
+
+    Latency and memory benchmarks for the recommenders.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Measures, for the real data and for synthetic catalogues of growing
+    size:
+
+    - cold-start import time of each `recommenders` module, and the
+      latency of the first call (which loads data and models lazily),
+      each in a fresh interpreter;
+    - per-call latency percentiles (p50/p95/p99) of `content_model`,
+      `collab_model` and `prediction_item` over randomly sampled seed
+      triples;
+    - peak traced memory (tracemalloc) of loading and of a single call,
+      and the peak resident set size of the process.
+
+    Every measurement runs in a subprocess whose working directory holds
+    the `resources` tree under test, so the modules load exactly as they
+    do in the app. Run from the repository root:
+
+        python -m benchmarks.bench_recommenders --output bench.json
+        python -m benchmarks.bench_recommenders --compare bench.json
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('recommenders.content_based', 'recommenders.collaborative_based')
+
+GENRES = ('Action', 'Adventure', 'Animation', 'Children', 'Comedy', 'Crime',
+          'Documentary', 'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'IMAX',
+          'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War',
+          'Western')
+
+
+def percentiles(samples):
+    """Summary statistics of latency samples, in milliseconds."""
+    samples = np.asarray(samples) * 1000
+    return {'mean_ms': float(samples.mean()),
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p95_ms': float(np.percentile(samples, 95)),
+            'p99_ms': float(np.percentile(samples, 99))}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in megabytes."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+# ---------------------------------------------------------------------
+# Measurements, each run inside a fresh interpreter.
+# ---------------------------------------------------------------------
+
+def measure_cold_start(module):
+    """Import time of a module, and latency of its first recommendation."""
+    import importlib
+    import tracemalloc
+
+    start = time.perf_counter()
+    recommender = importlib.import_module(module)
+    import_s = time.perf_counter() - start
+
+    from utils.catalogue import load_catalogue
+    seeds = load_catalogue('resources/data/movies.csv').titles[:3].tolist()
+    model = getattr(recommender, 'content_model', None) or recommender.collab_model
+    tracemalloc.start()
+    start = time.perf_counter()
+    model(seeds, top_n=10)
+    first_call_s = time.perf_counter() - start
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'import_ms': import_s * 1000, 'first_call_ms': first_call_s * 1000,
+            'first_call_peak_mb': load_peak / (1 << 20),
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def measure_latency(n_calls, seed, seed_pool):
+    """Per-call latency and memory of each entry point."""
+    import tracemalloc
+    from recommenders import collaborative_based, content_based
+    from utils.catalogue import load_catalogue
+
+    catalogue = load_catalogue('resources/data/movies.csv')
+    titles = catalogue.titles
+    if seed_pool:
+        titles = np.concatenate([titles[slice(*part)] for part in seed_pool])
+    rng = np.random.default_rng(seed)
+    triples = [titles[rng.choice(len(titles), 3, replace=False)].tolist()
+               for _ in range(n_calls)]
+    items = catalogue.movie_ids[rng.integers(0, len(catalogue), n_calls)].tolist()
+
+    entry_points = {
+        'content_model': lambda i: content_based.content_model(triples[i], 10),
+        'collab_model': lambda i: collaborative_based.collab_model(triples[i], 10),
+        'prediction_item': lambda i: collaborative_based.prediction_item(items[i]),
+    }
+    results = {}
+    for name, call in entry_points.items():
+        # Warm up, so lazy loading is not counted as call latency.
+        call(0)
+        timings = []
+        for i in range(n_calls):
+            start = time.perf_counter()
+            call(i)
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        call(0)
+        _, call_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = dict(percentiles(timings), calls=n_calls,
+                             call_peak_mb=call_peak / (1 << 20))
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def run_worker(task, workdir):
+    """Run a measurement in a fresh interpreter rooted at `workdir`."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [REPO_ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_recommenders',
+         '--worker', json.dumps(task)],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, check=True)
+    return json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+
+# ---------------------------------------------------------------------
+# Synthetic data.
+# ---------------------------------------------------------------------
+
+def make_synthetic_resources(workdir, n_movies, n_users, n_ratings, seed=0):
+    """Write a synthetic `resources` tree of the given size.
+
+    Movie popularity follows a Zipf-like distribution, as in MovieLens.
+
+    Parameters
+    ----------
+    workdir : str
+        Directory receiving `resources/data` and `resources/models`.
+    n_movies : int
+        Number of movies in the catalogue.
+    n_users : int
+        Number of distinct users.
+    n_ratings : int
+        Number of ratings.
+    seed : int
+        Seed of the generator.
+
+    """
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(workdir, 'resources', 'data')
+    model_dir = os.path.join(workdir, 'resources', 'models')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(model_dir, exist_ok=True)
+
+    genres = ['|'.join(rng.choice(GENRES, rng.integers(1, 4), replace=False))
+              for _ in range(n_movies)]
+    movies = pd.DataFrame({
+        'movieId': np.arange(1, n_movies + 1),
+        'title': ['Movie {} ({})'.format(i, 1920 + i % 100)
+                  for i in range(1, n_movies + 1)],
+        'genres': genres})
+    movies.to_csv(os.path.join(data_dir, 'movies.csv'), index=False)
+
+    popularity = 1.0 / np.arange(1, n_movies + 1)
+    ratings = pd.DataFrame({
+        'userId': rng.integers(1, n_users + 1, n_ratings),
+        'movieId': rng.choice(movies['movieId'].to_numpy(), n_ratings,
+                              p=popularity / popularity.sum()),
+        'rating': rng.integers(1, 11, n_ratings) / 2,
+        'timestamp': rng.integers(800000000, 1500000000, n_ratings)})
+    ratings = ratings.drop_duplicates(['userId', 'movieId'])
+    ratings.to_csv(os.path.join(data_dir, 'ratings.csv'), index=False)
+
+    from surprise import SVD, Dataset, Reader
+    from recommenders.factors import SVDFactors, publish_snapshot
+    trainset = Dataset.load_from_df(
+        ratings[['userId', 'movieId', 'rating']],
+        Reader(rating_scale=(0.5, 5))).build_full_trainset()
+    model = SVD(n_epochs=5, random_state=seed)
+    model.fit(trainset)
+    publish_snapshot(SVDFactors.from_surprise(model),
+                     os.path.join(model_dir, 'svd_factors'))
+
+
+# ---------------------------------------------------------------------
+# Reporting.
+# ---------------------------------------------------------------------
+
+def benchmark(workdir, n_calls, seed, seed_pool=None):
+    """All measurements for the resources rooted at `workdir`."""
+    report = {'cold_start': {}}
+    for module in MODULES:
+        report['cold_start'][module] = run_worker(
+            {'kind': 'cold_start', 'module': module}, workdir)
+    report['latency'] = run_worker(
+        {'kind': 'latency', 'n_calls': n_calls, 'seed': seed,
+         'seed_pool': seed_pool}, workdir)
+    return report
+
+
+def flatten(report, prefix=''):
+    """Flatten a nested report into dotted metric names."""
+    metrics = {}
+    for key, value in report.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            metrics[name] = value
+    return metrics
+
+
+def compare(report, baseline, threshold=1.2, min_delta=1.0):
+    """Print metrics of a report against a baseline report.
+
+    Parameters
+    ----------
+    report : dict
+        Current report.
+    baseline : dict
+        Report to compare against.
+    threshold : float
+        Ratio above which a metric counts as regressed.
+    min_delta : float
+        Absolute growth (ms or MB) below which differences are treated as
+        noise, whatever the ratio.
+
+    Returns
+    -------
+    list (str)
+        Timing or memory metrics that regressed.
+
+    """
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for name in sorted(current):
+        if name not in previous or not name.endswith(('_ms', '_mb')):
+            continue
+        ratio = current[name] / previous[name] if previous[name] else np.inf
+        flag = ''
+        if ratio > threshold and current[name] - previous[name] > min_delta:
+            regressions.append(name)
+            flag = '  <-- regression'
+        print('{:<70} {:>10.2f} {:>10.2f} {:>7.2f}x{}'.format(
+            name, previous[name], current[name], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark latency and memory of the recommenders.')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='Calls per entry point.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the sampled seed triples.')
+    parser.add_argument('--sizes', default='1000x500x20000,10000x2000x200000',
+                        help='Synthetic sizes as MOVIESxUSERSxRATINGS, '
+                             'comma separated; empty to skip.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Baseline JSON report to compare '
+                                          'against; exits non-zero on a '
+                                          'regression.')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        task = json.loads(args.worker)
+        if task['kind'] == 'cold_start':
+            result = measure_cold_start(task['module'])
+        else:
+            result = measure_latency(task['n_calls'], task['seed'],
+                                     task['seed_pool'])
+        print(json.dumps(result))
+        sys.exit(0)
+
+    # The three slices of the title list offered by the app.
+    app_seed_pool = [(14930, 15200), (25055, 25255), (21100, 21200)]
+    full_report = {'python': sys.version.split()[0],
+                   'numpy': np.__version__,
+                   'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'real': benchmark(REPO_ROOT, args.calls, args.seed,
+                                     app_seed_pool),
+                   'synthetic': {}}
+    for size in filter(None, args.sizes.split(',')):
+        n_movies, n_users, n_ratings = map(int, size.split('x'))
+        with tempfile.TemporaryDirectory() as workdir:
+            make_synthetic_resources(workdir, n_movies, n_users, n_ratings,
+                                     seed=args.seed)
+            full_report['synthetic'][size] = benchmark(workdir, args.calls,
+                                                       args.seed)
+
+    print(json.dumps(full_report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(full_report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(full_report, json.load(f))
+        sys.exit(1 if regressed else 0)
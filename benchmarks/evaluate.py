@@ -0,0 +1,378 @@
+"""
+
+    Offline evaluation of ranking quality and cost of the recommenders.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Each evaluated user's ratings are split into training and held-out
+    ratings, either the user's last `holdout` ratings in time ('time') or
+    `holdout` random ones ('random'). The app user experience is then
+    replayed: the user's three best training movies are the seeds, and an
+    engine's top-k recommendations are compared with the held-out movies
+    rated at least `relevant_rating`:
+
+    - precision@k, the share of recommendations that are relevant;
+    - recall@k, the share of relevant movies recommended;
+    - NDCG@k, with binary relevance;
+    - coverage, the share of the catalogue recommended to anyone.
+
+    Recommendations are replayed with one recommender call per user, as
+    the app makes them, so latencies are those of single requests; the
+    metrics are then computed for all users at once. Users are spread
+    over a process pool, forked after the data and models are loaded.
+    Per-call latency percentiles are reported next to the quality
+    metrics, so index approximations and caching can be weighed against
+    accuracy.
+
+    The shipped models saw the held-out ratings, so by default every
+    model derived from ratings is refitted on the training split first
+    (`fitted_on`): the SVD factors are trained with `recommenders.training`
+    into a temporary snapshot, and the factor index, popularity table and
+    rating matrix are built from the training ratings, while the
+    precomputed neighbour store is bypassed. Content features use no
+    ratings. `--shipped-models` evaluates the shipped models instead, with
+    optimistic scores. Run from the repository root:
+
+        python -m benchmarks.evaluate --engines content collab hybrid
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import argparse
+import contextlib
+import importlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+from recommenders import (collaborative_based, content_based, neighbour_store,
+                          popularity, training)
+from recommenders.factors import publish_snapshot
+from utils.catalogue import load_catalogue
+from utils.data_loader import drop_cache, load_ratings
+from utils.lazy import reset_all
+
+MOVIES_PATH = 'resources/data/movies.csv'
+RATINGS_PATH = 'resources/data/ratings.csv'
+
+# Engines that can be evaluated, and the function serving each.
+ENGINES = {
+    'content': ('recommenders.content_based', 'content_model'),
+    'collab': ('recommenders.collaborative_based', 'collab_model'),
+    'collab:factors': ('recommenders.collaborative_based', 'factor_model'),
+    'collab:neighbours': ('recommenders.collaborative_based', 'neighbourhood_model'),
+    'collab:foldin': ('recommenders.collaborative_based', 'foldin_model'),
+    'hybrid': ('recommenders.hybrid', 'hybrid_model'),
+}
+
+# Number of seed movies per query, as in the app.
+N_SEEDS = 3
+
+
+def _engine(name):
+    module, function = ENGINES[name]
+    return getattr(importlib.import_module(module), function)
+
+
+def split_ratings(ratings, holdout=5, method='time', min_train=N_SEEDS,
+                  seed=0):
+    """Split every eligible user's ratings into training and held-out.
+
+    Parameters
+    ----------
+    ratings : Pandas Dataframe
+        Ratings with `userId`, `movieId`, `rating` and `timestamp` columns.
+    holdout : int
+        Number of ratings held out per user.
+    method : str
+        'time' holds out each user's latest ratings, 'random' random ones.
+    min_train : int
+        Minimum number of training ratings a user needs.
+    seed : int
+        Seed of the random split.
+
+    Returns
+    -------
+    tuple (Pandas Dataframe, Pandas Dataframe)
+        Training and held-out ratings of the users with at least
+        `holdout + min_train` ratings.
+
+    """
+    counts = ratings['userId'].value_counts()
+    eligible = ratings[ratings['userId'].isin(counts.index[counts >= holdout + min_train])]
+    if method == 'time':
+        order = eligible['timestamp'].to_numpy()
+    else:
+        order = np.random.default_rng(seed).random(len(eligible))
+    ranked = eligible.assign(_order=order).sort_values(['userId', '_order'])
+    # Position of each rating from the end of its user's sequence
+    from_end = ranked.groupby('userId').cumcount(ascending=False)
+    held_out = from_end < holdout
+    columns = list(ratings.columns)
+    return ranked.loc[~held_out, columns], ranked.loc[held_out, columns]
+
+
+@contextlib.contextmanager
+def fitted_on(train, workdir, **train_options):
+    """Serve the recommenders from models fitted on training ratings only.
+
+    Parameters
+    ----------
+    train : Pandas Dataframe
+        Training ratings.
+    workdir : str
+        Directory receiving the training ratings and fitted models.
+    **train_options
+        Passed on to `training.train_factors`.
+
+    """
+    ratings_path = os.path.join(workdir, 'ratings.csv')
+    train.to_csv(ratings_path, index=False)
+    factors_path = os.path.join(workdir, 'svd_factors')
+    publish_snapshot(training.train_factors(ratings_path, workdir=workdir,
+                                            **train_options), factors_path)
+    paths = [(collaborative_based, 'RATINGS_PATH', ratings_path),
+             (collaborative_based, 'FACTORS_PATH', factors_path),
+             (collaborative_based, 'FACTOR_INDEX_PATH',
+              os.path.join(workdir, 'SVD_ann.npz')),
+             (popularity, 'RATINGS_PATH', ratings_path),
+             (popularity, 'POPULARITY_PATH', os.path.join(workdir, 'popularity.npz')),
+             # Lists computed from every rating; none exists here.
+             (neighbour_store, 'STORE_PATH', os.path.join(workdir, 'neighbours.npz'))]
+    shipped = [(module, name, getattr(module, name)) for module, name, _ in paths]
+    watchers = (collaborative_based.model_watcher, content_based.catalogue_watcher)
+    try:
+        for module, name, path in paths:
+            setattr(module, name, path)
+        reset_all()
+        # The paths changed on purpose; watchers must not reload again.
+        for watcher in watchers:
+            watcher.sync()
+        yield
+    finally:
+        for module, name, path in shipped:
+            setattr(module, name, path)
+        reset_all()
+        for watcher in watchers:
+            watcher.sync()
+        drop_cache(ratings_path)
+
+
+def build_queries(train, test, catalogue, relevant_rating=4.0, n_users=1000,
+                  seed=0):
+    """Seed titles and relevant movies of a sample of users.
+
+    Parameters
+    ----------
+    train : Pandas Dataframe
+        Training ratings.
+    test : Pandas Dataframe
+        Held-out ratings.
+    catalogue : Catalogue
+        Movie catalogue, to map Movie IDs to titles.
+    relevant_rating : float
+        Minimum held-out rating of a relevant movie.
+    n_users : int
+        Maximum number of users to sample.
+    seed : int
+        Seed of the sample.
+
+    Returns
+    -------
+    tuple (np.ndarray, list, Pandas Dataframe)
+        Sampled user IDs, their seed titles, and their relevant
+        (`userId`, `movieId`) pairs.
+
+    """
+    relevant = test[test['rating'] >= relevant_rating][['userId', 'movieId']]
+    train = train[np.isin(train['movieId'], catalogue.movie_ids)]
+    # Each user's best training movies, latest first among equal ratings
+    best = (train.sort_values(['userId', 'rating', 'timestamp'],
+                              ascending=[True, False, False])
+            .groupby('userId').head(N_SEEDS))
+    seeds = best.groupby('userId')['movieId'].apply(list)
+    seeds = seeds[seeds.str.len() == N_SEEDS]
+    users = np.intersect1d(seeds.index.to_numpy(), relevant['userId'].unique())
+    rng = np.random.default_rng(seed)
+    users = np.sort(rng.choice(users, min(n_users, len(users)), replace=False))
+    seed_titles = [catalogue.titles_for_movie_ids(seeds[user]) for user in users]
+    return users, seed_titles, relevant[relevant['userId'].isin(users)]
+
+
+def _run_queries(task):
+    """Recommendations and latencies of a chunk of queries, in a worker."""
+    engine, queries, k = task
+    recommender = _engine(engine)
+    catalogue = load_catalogue(MOVIES_PATH)
+    recommended = np.full((len(queries), k), -1, dtype=np.int64)
+    latencies = np.empty(len(queries))
+    errors = 0
+    for i, seed_titles in enumerate(queries):
+        start = time.perf_counter()
+        try:
+            titles = recommender(seed_titles, k)
+        except Exception:
+            # A failed query counts as an empty recommendation list.
+            titles = []
+            errors += 1
+        latencies[i] = time.perf_counter() - start
+        ids = [catalogue.movie_id_for_title(title) for title in titles[:k]]
+        recommended[i, :len(ids)] = ids
+    return recommended, latencies, errors
+
+
+def ranking_metrics(recommended, users, relevant, n_items):
+    """Precision, recall, NDCG at k and coverage of recommendations.
+
+    Parameters
+    ----------
+    recommended : np.ndarray (int)
+        Recommended Movie IDs, one row per user, best first, padded
+        with -1.
+    users : np.ndarray (int)
+        User ID of each row.
+    relevant : Pandas Dataframe
+        Relevant (`userId`, `movieId`) pairs.
+    n_items : int
+        Size of the catalogue, for coverage.
+
+    Returns
+    -------
+    dict
+        Mean precision@k, recall@k and NDCG@k over users, and coverage.
+
+    """
+    n_users, k = recommended.shape
+    rows = np.searchsorted(users, relevant['userId'].to_numpy())
+    movie_ids = relevant['movieId'].to_numpy(dtype=np.int64)
+    # Encode (row, movie) pairs as single integers to test membership at once
+    base = int(max(recommended.max(), movie_ids.max(initial=0))) + 2
+    relevant_keys = rows * base + movie_ids
+    recommended_keys = np.arange(n_users)[:, np.newaxis] * base + recommended
+    hits = np.isin(recommended_keys, relevant_keys) & (recommended >= 0)
+    n_relevant = np.bincount(rows, minlength=n_users)
+
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    recommended_ids = recommended[recommended >= 0]
+    return {'precision': float(hits.sum(axis=1).mean() / k),
+            'recall': float((hits.sum(axis=1) / n_relevant).mean()),
+            'ndcg': float((dcg / ideal).mean()),
+            'coverage': float(len(np.unique(recommended_ids)) / n_items),
+            'users': int(n_users)}
+
+
+def evaluate(engines, holdout=5, method='time', k=10, n_users=1000,
+             relevant_rating=4.0, processes=None, chunk_size=50, seed=0,
+             shipped_models=False, train_options=None):
+    """Evaluate engines on a split of the ratings.
+
+    Parameters
+    ----------
+    engines : list (str)
+        Names of engines from `ENGINES`.
+    holdout : int
+        Number of ratings held out per user.
+    method : str
+        'time' or 'random' split.
+    k : int
+        Number of recommendations per user.
+    n_users : int
+        Maximum number of users evaluated.
+    relevant_rating : float
+        Minimum held-out rating of a relevant movie.
+    processes : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+    chunk_size : int
+        Number of users handed to a worker at a time.
+    seed : int
+        Seed of the split and user sample.
+    shipped_models : bool
+        Evaluate the shipped models, fitted on the held-out ratings too,
+        instead of models fitted on the training split.
+    train_options : dict, optional
+        Passed on to `training.train_factors` when fitting on the split.
+
+    Returns
+    -------
+    dict
+        Quality and latency metrics per engine.
+
+    """
+    catalogue = load_catalogue(MOVIES_PATH)
+    ratings = load_ratings(RATINGS_PATH)
+    train, test = split_ratings(ratings, holdout=holdout, method=method, seed=seed)
+    users, queries, relevant = build_queries(train, test, catalogue,
+                                             relevant_rating=relevant_rating,
+                                             n_users=n_users, seed=seed)
+    chunks = [queries[start:start + chunk_size]
+              for start in range(0, len(queries), chunk_size)]
+    report = {}
+    with contextlib.ExitStack() as stack:
+        if not shipped_models:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(fitted_on(train, workdir, **(train_options or {})))
+        for engine in engines:
+            # Load data and models once in the parent, so forked workers share them.
+            _engine(engine)(queries[0], k)
+            start = time.perf_counter()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(_run_queries,
+                                   [(engine, chunk, k) for chunk in chunks])
+            wall_s = time.perf_counter() - start
+            recommended = np.concatenate([r[0] for r in results])
+            latencies = np.concatenate([r[1] for r in results]) * 1000
+            report[engine] = dict(
+                ranking_metrics(recommended, users, relevant, len(catalogue)),
+                p50_ms=float(np.percentile(latencies, 50)),
+                p95_ms=float(np.percentile(latencies, 95)),
+                queries_per_s=float(len(queries) / wall_s),
+                errors=int(sum(r[2] for r in results)))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Evaluate top-n ranking quality and latency.')
+    parser.add_argument('--engines', nargs='+', default=['content', 'collab', 'hybrid'],
+                        choices=sorted(ENGINES))
+    parser.add_argument('--split', choices=('time', 'random'), default='time')
+    parser.add_argument('--holdout', type=int, default=5,
+                        help='Ratings held out per user.')
+    parser.add_argument('-k', type=int, default=10,
+                        help='Recommendations per user.')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='Maximum number of users evaluated.')
+    parser.add_argument('--relevant-rating', type=float, default=4.0,
+                        help='Minimum held-out rating of a relevant movie.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shipped-models', action='store_true',
+                        help='Evaluate the shipped models, which saw the '
+                             'held-out ratings, instead of refitting them '
+                             'on the training split.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    args = parser.parse_args()
+
+    evaluation = evaluate(args.engines, holdout=args.holdout, method=args.split,
+                          k=args.k, n_users=args.users,
+                          relevant_rating=args.relevant_rating,
+                          processes=args.processes, seed=args.seed,
+                          shipped_models=args.shipped_models)
+    print('{:<20} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'engine', 'prec@k', 'recall@k', 'ndcg@k', 'coverage', 'p50 ms', 'p95 ms'))
+    for name, result in evaluation.items():
+        print('{:<20} {:>9.4f} {:>9.4f} {:>9.4f} {:>9.4f} {:>9.2f} {:>9.2f}'.format(
+            name, result['precision'], result['recall'], result['ndcg'],
+            result['coverage'], result['p50_ms'], result['p95_ms']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(evaluation, f, indent=2)
@@ -29,6 +29,7 @@
 import streamlit as st
 
 # Data handling dependencies
+import os
 import pandas as pd
 import numpy as np
 import pickle
@@ -36,19 +37,46 @@ from PIL import Image
 
 # Custom Libraries
 from utils.data_loader import load_movie_titles
-from recommenders.collaborative_based import collab_model
-from recommenders.content_based import content_model
+from utils.title_search import load_title_index
+if os.environ.get('RECOMMENDER_SERVICE_URL'):
+    # Recommenders run in the local recommendation service.
+    from recommenders.client import remote_model
+    collab_model = remote_model('collab')
+    content_model = remote_model('content')
+    hybrid_model = remote_model('hybrid')
+else:
+    # Recommenders are served through a cache shared by all sessions.
+    from recommenders.cache import cached_collab_model as collab_model
+    from recommenders.cache import cached_content_model as content_model
+    from recommenders.cache import cached_hybrid_model as hybrid_model
 
 # Data Loading
 title_list = load_movie_titles('resources/data/movies.csv')
 
+def title_picker(label, default_titles):
+    """Select a movie by typing part of its title.
+
+    Only the best matches of the typed query are sent to the browser, so
+    any movie of the catalogue can be picked; `default_titles` are
+    offered until something is typed. Returns None when nothing matches.
+    """
+    query = st.text_input('Search ' + label.lower())
+    if query:
+        options = load_title_index('resources/data/movies.csv').search(query, limit=20)
+    else:
+        options = default_titles
+    if not options:
+        st.warning('No movie matches "{}"'.format(query))
+        return None
+    return st.selectbox(label, options)
+
 # App declaration
 def main():
 
     # DO NOT REMOVE the 'Recommender System' option below, however,
     # you are welcome to add more options to enrich your app.
-    page_options = ["Recommender System","Solution Overview", "About Us",
-                   "Contact Us"]
+    page_options = ["Recommender System","Hybrid Recommender",
+                    "Solution Overview", "About Us", "Contact Us"]
 
     # -------------------------------------------------------------------
     # ----------- !! THIS CODE MUST NOT BE ALTERED !! -------------------
@@ -103,6 +131,31 @@ def main():
     # -------------------------------------------------------------------
 
     # ------------- SAFE FOR ALTERING/EXTENSION -------------------
+    if page_selection == "Hybrid Recommender":
+        # Blends content-based and collaborative scores, see recommenders.hybrid
+        st.write('# Hybrid Movie Recommender')
+        st.write('### Enter Your Three Favorite Movies')
+        movie_1 = title_picker('First Option',title_list[14930:15200])
+        movie_2 = title_picker('Second Option',title_list[25055:25255])
+        movie_3 = title_picker('Third Option',title_list[21100:21200])
+        # Selectors without a match are left out
+        fav_movies = [movie for movie in (movie_1,movie_2,movie_3) if movie]
+
+        if st.button("Recommend"):
+            if not fav_movies:
+                st.error("Please pick at least one movie.")
+            else:
+                try:
+                    with st.spinner('Crunching the numbers...'):
+                        top_recommendations = hybrid_model(movie_list=fav_movies,
+                                                           top_n=10)
+                    st.title("We think you'll like:")
+                    for i,j in enumerate(top_recommendations):
+                        st.subheader(str(i+1)+'. '+j)
+                except:
+                    st.error("Oops! Looks like this algorithm does't work.\
+                              We'll need to fix it!")
+
     if page_selection == "Solution Overview":
         st.title("Solution Overview")
         st.write("This page describes the winning approach.")
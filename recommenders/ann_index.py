@@ -0,0 +1,375 @@
+"""
+
+    Approximate nearest-neighbour retrieval over SVD item factors.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Movies are compared by the cosine similarity of their latent factors
+    `qi`. `FactorIndex` is an inverted-file (IVF) index: the normalised
+    item vectors are clustered with spherical k-means, and a query only
+    scores the items of the `n_probe` clusters whose centroids are
+    closest to it. Probing every cluster gives exact search, which is
+    also available directly through `search_exact`.
+
+    Brute-force search over a few thousand items takes well under a
+    millisecond, so indexes smaller than `EXACT_SEARCH_LIMIT` are always
+    searched exactly.
+
+    The index is persisted next to the model it was built from, and is
+    rebuilt when the contents of the model's manifest change, see
+    `file_signature`; a fresh checkout or a touched file does not force a
+    rebuild. To rebuild it offline and report recall@k against exact
+    search for a range of `n_probe` values:
+
+        python -m recommenders.ann_index --report
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import os
+import time
+import numpy as np
+from recommenders.factors import top_k
+from utils.data_loader import file_signature
+from utils.instrumentation import timed
+
+INDEX_PATH = 'resources/models/SVD_ann.npz'
+
+# Number of clusters probed per query unless specified otherwise.
+DEFAULT_N_PROBE = 16
+# Below this many items brute-force search is fast enough to always be
+# used, see `FactorIndex.search`.
+EXACT_SEARCH_LIMIT = 20000
+
+
+def normalise_rows(vectors):
+    """Scale each row to unit length, leaving all-zero rows untouched."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=0):
+    """Cluster unit vectors by cosine similarity.
+
+    Parameters
+    ----------
+    vectors : np.ndarray (float32)
+        Unit-length vectors, shape (n, d).
+    n_clusters : int
+        Number of clusters.
+    n_iter : int
+        Number of assignment/update rounds.
+    seed : int
+        Seed of the initial centroid sample.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Unit-length centroids, shape (n_clusters, d), and the cluster of
+        each vector.
+
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        # Re-seed clusters that lost all their members.
+        empty = np.flatnonzero(np.bincount(assignment, minlength=n_clusters) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalise_rows(sums)
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, assignment
+
+
+class FactorIndex:
+    """Inverted-file index over normalised item factors.
+
+    Parameters
+    ----------
+    item_ids : np.ndarray (int)
+        Raw Movie ID of each indexed item.
+    vectors : np.ndarray (float32)
+        Unit-length item factors, shape (n_items, n_factors).
+    centroids : np.ndarray (float32)
+        Unit-length cluster centroids, shape (n_lists, n_factors).
+    list_items : np.ndarray (int32)
+        Item positions grouped by cluster.
+    list_offsets : np.ndarray (int64)
+        Start of each cluster within `list_items`, plus the total length.
+    signature : str
+        Signature of the model file the index was built from.
+
+    """
+
+    def __init__(self, item_ids, vectors, centroids, list_items, list_offsets,
+                 signature=''):
+        self.item_ids = item_ids
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_items = list_items
+        self.list_offsets = list_offsets
+        self.signature = signature
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    @classmethod
+    def build(cls, item_ids, item_factors, n_lists=None, signature='', seed=0):
+        """Cluster item factors into an inverted-file index.
+
+        Parameters
+        ----------
+        item_ids : np.ndarray (int)
+            Raw Movie ID of each row of `item_factors`.
+        item_factors : np.ndarray
+            Item factors, shape (n_items, n_factors).
+        n_lists : int, optional
+            Number of clusters, defaults to the square root of n_items.
+        signature : str
+            Signature of the model file, stored alongside the index.
+        seed : int
+            Seed of the clustering.
+
+        Returns
+        -------
+        FactorIndex
+            The built index.
+
+        """
+        vectors = normalise_rows(item_factors)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        centroids, assignment = spherical_kmeans(vectors, n_lists, seed=seed)
+        list_items = np.argsort(assignment, kind='stable').astype(np.int32)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return cls(np.asarray(item_ids), vectors, centroids, list_items,
+                   list_offsets, signature=signature)
+
+    def save(self, path=INDEX_PATH):
+        """Persist the index as a `.npz` archive."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, item_ids=self.item_ids, vectors=self.vectors,
+                 centroids=self.centroids, list_items=self.list_items,
+                 list_offsets=self.list_offsets,
+                 signature=np.array(self.signature))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """Load an index previously written with `save`."""
+        with np.load(path, allow_pickle=False) as archive:
+            return cls(archive['item_ids'], archive['vectors'],
+                       archive['centroids'], archive['list_items'],
+                       archive['list_offsets'],
+                       signature=str(archive['signature']))
+
+    @timed('factor_search')
+    def search(self, query, k, n_probe=DEFAULT_N_PROBE, allowed=None):
+        """Top-k items by cosine similarity to a query.
+
+        Falls back to exact search for small indexes, or when every
+        cluster would be probed anyway.
+
+        Parameters
+        ----------
+        query : np.ndarray
+            Query vector in factor space.
+        k : int
+            Number of items to return.
+        n_probe : int
+            Number of clusters to score.
+        allowed : np.ndarray (bool), optional
+            Items that may be returned, e.g. the popular candidates;
+            every item by default.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray)
+            Item positions, best first, and their similarity.
+
+        """
+        if len(self) <= EXACT_SEARCH_LIMIT or n_probe >= self.n_lists:
+            return self.search_exact(query, k, allowed=allowed)
+        return self.search_ivf(query, k, n_probe=n_probe, allowed=allowed)
+
+    def search_ivf(self, query, k, n_probe=DEFAULT_N_PROBE, allowed=None):
+        """Approximate top-k items by cosine similarity to a query.
+
+        Parameters
+        ----------
+        query : np.ndarray
+            Query vector in factor space.
+        k : int
+            Number of items to return.
+        n_probe : int
+            Number of clusters to score.
+        allowed : np.ndarray (bool), optional
+            Items that may be returned; every item by default.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray)
+            Item positions, best first, and their similarity.
+
+        """
+        query = normalise_rows(query[np.newaxis])[0]
+        probes = top_k(self.centroids @ query, n_probe)
+        candidates = np.concatenate(
+            [self.list_items[self.list_offsets[p]:self.list_offsets[p + 1]]
+             for p in probes])
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def search_exact(self, query, k, allowed=None):
+        """Exact top-k items by cosine similarity to a query, among the
+        `allowed` ones if given."""
+        query = normalise_rows(query[np.newaxis])[0]
+        if allowed is None:
+            scores = self.vectors @ query
+            best = top_k(scores, k)
+            return best, scores[best]
+        candidates = np.flatnonzero(allowed)
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+def load_or_build_index(factors, model_path, path=INDEX_PATH):
+    """Load the persisted factor index, rebuilding it if missing or stale.
+
+    Parameters
+    ----------
+    factors : SVDFactors
+        Factors of the model loaded from `model_path`.
+    model_path : str
+        Model file used to detect a stale index.
+    path : str
+        Location of the persisted index.
+
+    Returns
+    -------
+    FactorIndex
+        An index aligned with the rows of `factors.qi`.
+
+    """
+    signature = file_signature(model_path)
+    if os.path.exists(path):
+        index = FactorIndex.load(path)
+        if index.signature == signature and len(index) == len(factors.qi):
+            return index
+    index = FactorIndex.build(factors.item_ids, factors.qi, signature=signature)
+    index.save(path)
+    return index
+
+
+def recall_report(index, k=10, n_queries=200, n_probes=(1, 2, 4, 8, 16, 32),
+                  seeds_per_query=1, seed=0):
+    """Measure recall@k and latency of approximate against exact search.
+
+    Queries are the mean factor vector of `seeds_per_query` randomly
+    sampled items. The app queries one chosen movie at a time, see
+    `collaborative_based.collab_neighbours`.
+
+    Parameters
+    ----------
+    index : FactorIndex
+        The index to evaluate.
+    k : int
+        Number of items retrieved per query.
+    n_queries : int
+        Number of random queries.
+    n_probes : tuple (int)
+        Values of `n_probe` to evaluate.
+    seeds_per_query : int
+        Number of items averaged into each query.
+    seed : int
+        Seed of the query sample.
+
+    Returns
+    -------
+    list (dict)
+        One row per setting with `n_probe`, `recall`, and the mean and
+        95th percentile latency in milliseconds. The exact search row has
+        `n_probe` set to 'exact'.
+
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, len(index), size=(n_queries, seeds_per_query))
+    queries = index.vectors[samples].mean(axis=1)
+
+    def _run_queries(search):
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query)[0])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return results, np.array(latencies)
+
+    exact, latencies = _run_queries(lambda q: index.search_exact(q, k))
+    report = [{'n_probe': 'exact', 'recall': 1.0,
+               'mean_ms': latencies.mean(),
+               'p95_ms': np.percentile(latencies, 95)}]
+    for n_probe in n_probes:
+        found, latencies = _run_queries(
+            lambda q: index.search_ivf(q, k, n_probe=n_probe))
+        recall = np.mean([len(np.intersect1d(a, e)) / len(e)
+                          for a, e in zip(found, exact)])
+        report.append({'n_probe': n_probe, 'recall': recall,
+                       'mean_ms': latencies.mean(),
+                       'p95_ms': np.percentile(latencies, 95)})
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from recommenders.factors import SVDFactors, current_snapshot
+
+    parser = argparse.ArgumentParser(
+        description='Rebuild the item factor index of the SVD model.')
+    parser.add_argument('--factors', default='resources/models/svd_factors',
+                        help='Directory holding the factor snapshots.')
+    parser.add_argument('--output', default=INDEX_PATH,
+                        help='Where to write the index (.npz).')
+    parser.add_argument('--n-lists', type=int, default=None,
+                        help='Number of clusters (default: sqrt(n_items)).')
+    parser.add_argument('--report', action='store_true',
+                        help='Report recall@k and latency against exact search.')
+    parser.add_argument('-k', type=int, default=10,
+                        help='Number of items retrieved in the report.')
+    args = parser.parse_args()
+
+    snapshot = current_snapshot(args.factors)
+    if snapshot is None:
+        parser.error('no factor snapshot under {}, export one with '
+                     'recommenders.factors'.format(args.factors))
+    svd_factors = SVDFactors.load(snapshot)
+    start = time.time()
+    factor_index = FactorIndex.build(
+        svd_factors.item_ids, svd_factors.qi, n_lists=args.n_lists,
+        signature=file_signature(os.path.join(snapshot, 'meta.json')))
+    factor_index.save(args.output)
+    print('Indexed {} items into {} lists in {:.1f}s -> {}'.format(
+        len(factor_index), factor_index.n_lists, time.time() - start,
+        args.output))
+    if args.report:
+        print('{:>8} {:>10} {:>10} {:>10}'.format(
+            'n_probe', 'recall@' + str(args.k), 'mean ms', 'p95 ms'))
+        for row in recall_report(factor_index, k=args.k):
+            print('{n_probe:>8} {recall:>10.3f} {mean_ms:>10.3f} '
+                  '{p95_ms:>10.3f}'.format(**row))
@@ -0,0 +1,181 @@
+"""
+
+    Cache of recommendation results shared by all app sessions.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Many app users pick the same three movies from the same short lists,
+    so results are cached per (algorithm, seed movies, top_n). The seed
+    movies are keyed order-insensitively, as every recommender treats
+    them as a set. The cache is bounded in size with least-recently-used
+    eviction, entries expire after a time-to-live, and everything is
+    dropped as soon as one of the data or model files it depends on
+    changes.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import collections
+import functools
+import os
+import threading
+import time
+from recommenders.collaborative_based import collab_model
+from recommenders.content_based import content_model
+from recommenders.hybrid import hybrid_model
+from utils.instrumentation import register_gauge
+
+# Files whose contents determine the recommendations.
+WATCHED_FILES = ('resources/data/movies.csv',
+                 'resources/data/ratings.csv',
+                 'resources/models/svd_factors/CURRENT',
+                 'resources/data/tags.csv',
+                 'resources/data/genome_scores.csv',
+                 'resources/models/content_features.npz',
+                 'resources/models/SVD_ann.npz',
+                 'resources/models/neighbours.npz')
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class RecommendationCache:
+    """Thread-safe LRU cache with expiry and file-based invalidation.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of cached results.
+    ttl : float
+        Seconds after which a cached result expires.
+    watched_files : tuple (str)
+        Files whose modification invalidates the whole cache.
+    check_interval : float
+        Minimum number of seconds between checks of `watched_files`.
+
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, watched_files=WATCHED_FILES,
+                 check_interval=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.watched_files = tuple(watched_files)
+        self.check_interval = check_interval
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._signatures = self._file_signatures()
+        self._checked_at = time.monotonic()
+        self.counters = collections.Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(algorithm, movie_list, top_n):
+        """Cache key of a request, independent of the order of the seeds."""
+        return algorithm, tuple(sorted(movie_list)), top_n
+
+    def _file_signatures(self):
+        return [_signature(path) for path in self.watched_files]
+
+    def _check_files(self, now):
+        # Called with the lock held.
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        signatures = self._file_signatures()
+        if signatures != self._signatures:
+            self._signatures = signatures
+            self._entries.clear()
+            self.counters['invalidations'] += 1
+
+    def get(self, key):
+        """Cached value of a key, or None when absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_files(now)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        """Drop every cached value."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit, miss, eviction, expiry and invalidation counts, and size."""
+        with self._lock:
+            stats = dict(self.counters, size=len(self._entries))
+        for name in ('hits', 'misses', 'evictions', 'expirations',
+                     'invalidations'):
+            stats.setdefault(name, 0)
+        return stats
+
+
+# Cache shared by every session of the app.
+recommendation_cache = RecommendationCache()
+register_gauge('recommendation_cache', recommendation_cache.stats)
+
+
+def cached(algorithm, recommender, cache=recommendation_cache):
+    """Serve a recommender's results through a cache.
+
+    Parameters
+    ----------
+    algorithm : str
+        Name of the algorithm, part of the cache key.
+    recommender : callable
+        Function with the `(movie_list, top_n=10)` signature of
+        `content_model`, `collab_model` and `hybrid_model`.
+    cache : RecommendationCache
+        Cache to use.
+
+    Returns
+    -------
+    callable
+        The recommender with the same signature, returning cached results
+        when available.
+
+    """
+    @functools.wraps(recommender)
+    def wrapper(movie_list, top_n=10):
+        key = cache.make_key(algorithm, movie_list, top_n)
+        recommendations = cache.get(key)
+        if recommendations is None:
+            recommendations = recommender(movie_list, top_n)
+            cache.put(key, recommendations)
+        # Callers get their own copy, so the cached list cannot be altered.
+        return list(recommendations)
+    return wrapper
+
+
+cached_content_model = cached('content', content_model)
+cached_collab_model = cached('collab', collab_model)
+cached_hybrid_model = cached('hybrid', hybrid_model)
@@ -0,0 +1,120 @@
+"""
+
+    Client of the local recommendation service.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Lets the app call the recommenders running in `recommenders.service`
+    instead of running them in its own process. Only the standard library
+    is used, so importing the client loads no data or models.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import json
+import os
+import urllib.error
+import urllib.request
+
+# Address of the service, e.g. http://127.0.0.1:8765.
+SERVICE_URL = os.environ.get('RECOMMENDER_SERVICE_URL', 'http://127.0.0.1:8765')
+
+
+class RecommendationServiceError(RuntimeError):
+    """Raised when the service is unreachable or cannot answer a request."""
+
+
+class RecommendationClient:
+    """HTTP client of a `RecommendationService`.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the service.
+    timeout : float
+        Seconds to wait for an answer.
+
+    """
+
+    def __init__(self, url=SERVICE_URL, timeout=15.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(
+            self.url + path, data=data,
+            headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RecommendationServiceError('{} {}'.format(e.code, e.reason)) from e
+        except (urllib.error.URLError, OSError) as e:
+            raise RecommendationServiceError(str(e)) from e
+
+    def health(self):
+        """Status of the service."""
+        return self._call('/health')
+
+    def recommend_batch(self, requests):
+        """Answer several requests in one round trip.
+
+        Parameters
+        ----------
+        requests : list (dict)
+            Requests with `seeds` (list of titles), `algorithm` and an
+            optional `top_n`.
+
+        Returns
+        -------
+        list (dict)
+            One result per request: `{"recommendations": [...]}` or
+            `{"error": "..."}`.
+
+        """
+        return self._call('/recommend', {'requests': list(requests)})['results']
+
+    def recommend(self, seeds, algorithm, top_n=10):
+        """Titles recommended for seed movies by one algorithm.
+
+        Raises
+        ------
+        RecommendationServiceError
+            If the service failed to answer the request.
+
+        """
+        result, = self.recommend_batch(
+            [{'seeds': list(seeds), 'algorithm': algorithm, 'top_n': top_n}])
+        if 'error' in result:
+            raise RecommendationServiceError(result['error'])
+        return result['recommendations']
+
+
+def remote_model(algorithm, client=None):
+    """A recommender served by the service.
+
+    Parameters
+    ----------
+    algorithm : str
+        Name of the algorithm on the service.
+    client : RecommendationClient, optional
+        Client to use, by default one for `SERVICE_URL`.
+
+    Returns
+    -------
+    callable
+        Function with the `(movie_list, top_n=10)` signature of
+        `content_model` and `collab_model`.
+
+    """
+    client = client or RecommendationClient()
+
+    def recommender(movie_list, top_n=10):
+        return client.recommend(movie_list, algorithm, top_n)
+    recommender.__name__ = '{}_model'.format(algorithm)
+    return recommender
@@ -30,21 +30,132 @@
 # Script dependencies
 import pandas as pd
 import numpy as np
-import pickle
+import os
 import copy
-from surprise import Reader, Dataset
-from surprise import SVD, NormalPredictor, BaselineOnly, KNNBasic, NMF
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import CountVectorizer
+from recommenders.ann_index import INDEX_PATH, load_or_build_index
+from recommenders.factors import SVDFactors, current_snapshot, top_k
+from recommenders.training import solve_row
+from recommenders.neighbour_store import get_neighbour_store, merge_neighbours
+from recommenders.popularity import (get_candidate_ids, get_popularity,
+                                     with_fallback)
+from recommenders.rating_matrix import RatingMatrix, item_similarity
+from utils.catalogue import load_catalogue
+from utils.data_loader import file_signature, load_rating_columns, load_ratings
+from utils.instrumentation import timed
+from utils.lazy import ChangeWatcher, lazy_resource
 
-# Importing data
-movies_df = pd.read_csv('resources/data/movies.csv',sep = ',',delimiter=',')
-ratings_df = pd.read_csv('resources/data/ratings.csv')
-ratings_df.drop(['timestamp'], axis=1,inplace=True)
+# Ratings the dataset users and their neighbourhoods are drawn from.
+RATINGS_PATH = 'resources/data/ratings.csv'
+# Snapshots of factors exported from the pickled model by
+# `recommenders.factors`, trained by `recommenders.training`, or updated
+# by `recommenders.updates`.
+FACTORS_PATH = 'resources/models/svd_factors'
+# Nearest-neighbour index over the live snapshot's item factors.
+FACTOR_INDEX_PATH = INDEX_PATH
 
-# We make use of an SVD model trained on a subset of the MovieLens 10k dataset.
-model=pickle.load(open('resources/models/SVD_algo.pkl', 'rb'))
+# How `collab_model` ranks movies: 'factors' retrieves the movies closest
+# to the chosen ones in the model's latent space, 'neighbours' ranks them
+# by item similarity over the ratings of similar dataset users, and
+# 'foldin' scores every movie for a pseudo-user who loves the chosen ones.
+# The first two build one neighbour list per chosen movie and merge them,
+# see `merged_model`.
+COLLAB_STRATEGY = os.environ.get('COLLAB_STRATEGY', 'factors')
 
+# Regularisation of the pseudo-user fold-in, scaled by the number of seeds.
+FOLD_IN_REG = 0.02
+
+# Number of neighbours kept per chosen movie, online and in the
+# precomputed store alike, so both rank the same.
+DEFAULT_K = 100
+
+# Data and models are loaded on first use, see `utils.lazy`.
+@lazy_resource
+def get_catalogue():
+    """Movie catalogue shared with the other recommenders."""
+    return load_catalogue('resources/data/movies.csv')
+
+@lazy_resource
+def get_title_index():
+    """Index resolving the chosen titles, built with the catalogue rather
+    than on the first title missing from it."""
+    return get_catalogue().title_index
+
+@lazy_resource
+def get_ratings():
+    """User ratings, without timestamps, as memory-mapped columns."""
+    return load_rating_columns(RATINGS_PATH,
+                               columns=('userId', 'movieId', 'rating'))
+
+@lazy_resource
+def get_rating_matrix():
+    """Ratings as a CSR user x item matrix."""
+    return RatingMatrix.from_ratings(get_ratings())
+
+@lazy_resource
+def get_factors():
+    """Factors of the SVD model trained on a subset of the MovieLens 10k
+    dataset, memory-mapped from the live snapshot, so every user can be
+    scored for an item with a single matrix-vector product."""
+    snapshot = current_snapshot(FACTORS_PATH)
+    if snapshot is None:
+        raise FileNotFoundError(
+            'no factor snapshot under {}; export one from the pickled model '
+            'with `python -m recommenders.factors`, or train one with '
+            '`python -m recommenders.training`'.format(FACTORS_PATH))
+    # Each snapshot is checked against its checksums when first loaded.
+    return SVDFactors.load(snapshot, verify=True)
+
+def model_file():
+    """File identifying the model served by `get_factors`."""
+    return os.path.join(get_factors().path, 'meta.json')
+
+@lazy_resource
+def get_factor_index():
+    """Nearest-neighbour index over the model's item factors."""
+    return load_or_build_index(get_factors(), model_file(), FACTOR_INDEX_PATH)
+
+@lazy_resource
+def get_candidate_rows():
+    """Factor rows of the popular movies candidates are drawn from, see
+    `recommenders.popularity`."""
+    rows = get_factors().item_rows
+    candidate_rows = np.array([rows.get(i, -1) for i in get_candidate_ids().tolist()],
+                              dtype=np.int64)
+    return np.sort(candidate_rows[candidate_rows >= 0])
+
+@lazy_resource
+def get_candidate_mask():
+    """Whether each factor row is a popular candidate."""
+    mask = np.zeros(len(get_factors().item_ids), dtype=bool)
+    mask[get_candidate_rows()] = True
+    return mask
+
+@lazy_resource
+def get_candidate_columns():
+    """Whether each column of the rating matrix is a popular candidate."""
+    return np.isin(get_rating_matrix().item_ids, get_candidate_ids())
+
+@lazy_resource
+def get_users():
+    """Users available for matching, and their rows within the factor arrays."""
+    user_ids = np.unique(get_ratings()['userId'])
+    return user_ids, get_factors().lookup_users(user_ids)
+
+# Publishing a new snapshot, appending movies to the catalogue, or adding
+# ratings swaps the data and models of running processes.
+model_watcher = ChangeWatcher(
+    lambda: (current_snapshot(FACTORS_PATH),
+             file_signature('resources/data/movies.csv'),
+             file_signature(RATINGS_PATH)),
+    load_catalogue.cache_clear, load_rating_columns.cache_clear,
+    load_ratings.cache_clear, get_catalogue.reset, get_title_index.reset,
+    get_ratings.reset, get_rating_matrix.reset, get_factors.reset,
+    get_factor_index.reset, get_users.reset, get_popularity.reset,
+    get_candidate_ids.reset, get_candidate_rows.reset,
+    get_candidate_mask.reset, get_candidate_columns.reset,
+    get_neighbour_store.reset)
+
+@timed()
 def prediction_item(item_id):
     """Map a given favourite movie to users within the
        MovieLens dataset with the same preference.
@@ -56,27 +167,22 @@ def prediction_item(item_id):
 
     Returns
     -------
-    list
-        User IDs of users with similar high ratings for the given movie.
+    np.ndarray (float32)
+        Predicted rating of the given movie by each user returned by
+        `get_users`.
 
     """
-    # Data preprosessing
-    reader = Reader(rating_scale=(0, 5))
-    load_df = Dataset.load_from_df(ratings_df,reader)
-    a_train = load_df.build_full_trainset()
-
-    predictions = []
-    for ui in a_train.all_users():
-        predictions.append(model.predict(iid=item_id,uid=ui, verbose = False))
-    return predictions
+    _, user_rows = get_users()
+    return get_factors().score_users(item_id, user_rows)
 
+@timed()
 def pred_movies(movie_list):
     """Maps the given favourite movies selected within the app to corresponding
     users within the MovieLens dataset.
 
     Parameters
     ----------
-    movie_list : list
+    movie_list : list (str)
         Three favourite movies selected by the app user.
 
     Returns
@@ -85,21 +191,260 @@ def pred_movies(movie_list):
         User-ID's of users with similar high ratings for each movie.
 
     """
+    user_ids, _ = get_users()
     # Store the id of users
     id_store=[]
     # For each movie selected by a user of the app,
     # predict a corresponding user within the dataset with the highest rating
-    for i in movie_list:
+    for i in get_catalogue().movie_ids_for_titles(movie_list).tolist():
         predictions = prediction_item(item_id = i)
-        predictions.sort(key=lambda x: x.est, reverse=True)
         # Take the top 10 user id's from each movie with highest rankings
-        for pred in predictions[:10]:
-            id_store.append(pred.uid)
+        id_store.extend(user_ids[top_k(predictions, 10)].tolist())
     # Return a list of user id's
     return id_store
 
+def neighbour_lists(seed_ids, strategy, k=DEFAULT_K):
+    """Collaborative neighbour lists of the chosen movies.
+
+    Read from the precomputed store when it holds lists of the same
+    length, computed with `collab_neighbours` otherwise; both give the
+    same lists, so recommendations do not depend on whether
+    `recommenders.precompute` has run.
+
+    Parameters
+    ----------
+    seed_ids : array-like (int)
+        Movie IDs of the chosen movies.
+    strategy : str
+        'factors' or 'neighbours', see `collab_neighbours`.
+    k : int
+        Maximum number of neighbours per chosen movie.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Neighbour Movie IDs and scores, one row per chosen movie.
+
+    """
+    lists = get_neighbour_store().lookup(strategy, seed_ids, k=k)
+    if lists is None:
+        lists = collab_neighbours(seed_ids, k=k, strategy=strategy)
+    return lists
+
+def merged_model(movie_list, top_n, strategy):
+    """Recommends the movies with the highest similarity summed over the
+       neighbour lists of the chosen movies.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+    strategy : str
+        'factors' or 'neighbours', see `collab_neighbours`.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    catalogue = get_catalogue()
+    seed_ids = catalogue.movie_ids_for_titles(movie_list)
+    top_ids, _ = merge_neighbours(*neighbour_lists(seed_ids, strategy),
+                                  exclude=seed_ids)
+    return catalogue.titles_for_movie_ids(top_ids.tolist())[:top_n]
+
+@timed()
+def factor_model(movie_list, top_n=10):
+    """Recommends the movies closest to the chosen movies in the latent
+       space of the SVD model.
+
+    Each chosen movie's nearest neighbours by cosine similarity of item
+    factors are merged, see `merged_model`. The index is no longer
+    queried once with the averaged factors of the chosen movies: merging
+    per-movie lists lets precomputed lists give the same ranking, and
+    keeps a movie far from the others from being averaged away.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    return merged_model(movie_list, top_n, 'factors')
+
+@timed()
+def neighbourhood_model(movie_list, top_n=10):
+    """Recommends the movies most similar to the chosen movies over the
+       ratings of the dataset users that would rate them highest.
+
+    Each chosen movie's neighbours are the movies most similar to it over
+    the ratings of the 10 dataset users predicted to rate it highest, and
+    the lists are merged, see `merged_model`. The original model instead
+    pooled those users for all chosen movies (30 users for three) and
+    scored similarity once over the pool; per-movie lists can be
+    precomputed, and rank the same whether they are or not.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    return merged_model(movie_list, top_n, 'neighbours')
+
+def fold_in(movie_ids, rating=None, reg=FOLD_IN_REG):
+    """Latent factors and bias of a pseudo-user who rated the given movies.
+
+    Solves the regularised least-squares problem of the model for a new
+    user's factors against the factors of the rated movies, without
+    refitting. The bias is fixed at the mean user bias: solved for as
+    well, it would absorb the constant ratings and leave factors too
+    small to personalise the ranking.
+
+    Parameters
+    ----------
+    movie_ids : array-like (int)
+        MovieLens Movie IDs rated by the pseudo-user.
+    rating : float, optional
+        Rating given to each movie, defaults to the top of the rating scale.
+    reg : float
+        L2 regularisation, scaled by the number of known movies.
+
+    Returns
+    -------
+    tuple (np.ndarray, float) or None
+        Factors and bias of the pseudo-user, or None when none of the
+        movies is known to the model.
+
+    """
+    factors = get_factors()
+    rows = [factors.item_rows[i] for i in movie_ids if i in factors.item_rows]
+    if not rows:
+        return None
+    rating = factors.rating_scale[1] if rating is None else rating
+    user_bias = float(np.mean(factors.bu))
+    # Without a column of ones, `solve_row` solves for the factors alone
+    fixed = np.column_stack([factors.qi[rows], factors.bi[rows] + user_bias])
+    solution = solve_row(fixed, np.full(len(rows), rating), factors.global_mean, reg)
+    return solution.astype(np.float32), user_bias
+
+@timed()
+def foldin_model(movie_list, top_n=10):
+    """Recommends the movies the SVD model predicts a pseudo-user, who
+       gave the chosen movies top ratings, would rate highest.
+
+    Unlike `pred_movies`, no dataset user is scanned: the pseudo-user is
+    folded into the model and every movie is scored in one pass.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    catalogue = get_catalogue()
+    factors = get_factors()
+    seed_ids = catalogue.movie_ids_for_titles(movie_list).tolist()
+    pseudo_user = fold_in(seed_ids)
+    if pseudo_user is None:
+        return []
+    user_factors, user_bias = pseudo_user
+    # Only popular candidates are scored. The global mean and user bias
+    # shift every score alike, so the ranking only needs the item bias
+    # and the factor product.
+    candidate_rows = get_candidate_rows()
+    scores = factors.bi[candidate_rows] + factors.qi[candidate_rows] @ user_factors
+    seed_rows = [factors.item_rows[i] for i in seed_ids if i in factors.item_rows]
+    scores[np.isin(candidate_rows, seed_rows)] = -np.inf
+    # Leave room for movies missing from the catalogue
+    items = candidate_rows[top_k(scores, 2 * top_n)]
+    rows = catalogue.rows_for_movie_ids(factors.item_ids[items].tolist())
+    return catalogue.titles_for_rows(rows[rows >= 0][:top_n])
+
+@timed()
+def collab_neighbours(movie_ids, k=DEFAULT_K, strategy=None):
+    """Collaborative neighbour lists of several movies.
+
+    With the 'factors' strategy, the neighbours of a movie are the movies
+    closest to it in the latent space of the SVD model. With the
+    'neighbours' strategy, they are the movies most similar to it over the
+    ratings of the 10 dataset users that would rate it highest. Either way
+    neighbours are drawn from the popular candidates only, see
+    `recommenders.popularity`.
+
+    Parameters
+    ----------
+    movie_ids : array-like (int)
+        MovieLens Movie IDs.
+    k : int
+        Maximum number of neighbours per movie.
+    strategy : str, optional
+        'factors' or 'neighbours', defaults to `COLLAB_STRATEGY`.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Neighbour Movie IDs (int32, padded with -1) and their similarity
+        (float32), one row per movie, most similar first.
+
+    """
+    strategy = strategy or COLLAB_STRATEGY
+    neighbours = np.full((len(movie_ids), k), -1, dtype=np.int32)
+    scores = np.zeros((len(movie_ids), k), dtype=np.float32)
+    for i, movie_id in enumerate(movie_ids):
+        if strategy == 'neighbours':
+            rating_matrix = get_rating_matrix()
+            user_ids, _ = get_users()
+            column = rating_matrix.item_index.get(movie_id)
+            if column is None:
+                continue
+            top_users = user_ids[top_k(prediction_item(movie_id), 10)]
+            similarity = item_similarity(rating_matrix.ratings_of(top_users),
+                                         [column])[:, 0]
+            similarity[column] = 0
+            candidates = np.flatnonzero((similarity > 0) & get_candidate_columns())
+            best = candidates[top_k(similarity[candidates], k)]
+            ids, sims = rating_matrix.item_ids[best], similarity[best]
+        else:
+            factor_index = get_factor_index()
+            row = get_factors().item_rows.get(movie_id)
+            if row is None:
+                continue
+            best, sims = factor_index.search(factor_index.vectors[row], k + 1,
+                                             allowed=get_candidate_mask())
+            keep = best != row
+            ids, sims = factor_index.item_ids[best[keep]][:k], sims[keep][:k]
+        neighbours[i, :len(ids)] = ids
+        scores[i, :len(ids)] = sims
+    return neighbours, scores
+
 # !! DO NOT CHANGE THIS FUNCTION SIGNATURE !!
 # You are, however, encouraged to change its content.  
+@timed()
 def collab_model(movie_list,top_n=10):
     """Performs Collaborative filtering based upon a list of movies supplied
        by the app user.
@@ -117,32 +462,17 @@ def collab_model(movie_list,top_n=10):
         Titles of the top-n movie recommendations to the user.
 
     """
-
-    indices = pd.Series(movies_df['title'])
-    movie_ids = pred_movies(movie_list)
-    df_init_users = ratings_df[ratings_df['userId']==movie_ids[0]]
-    for i in movie_ids :
-        df_init_users=df_init_users.append(ratings_df[ratings_df['userId']==i])
-    # Getting the cosine similarity matrix
-    cosine_sim = cosine_similarity(np.array(df_init_users), np.array(df_init_users))
-    idx_1 = indices[indices == movie_list[0]].index[0]
-    idx_2 = indices[indices == movie_list[1]].index[0]
-    idx_3 = indices[indices == movie_list[2]].index[0]
-    # Creating a Series with the similarity scores in descending order
-    rank_1 = cosine_sim[idx_1]
-    rank_2 = cosine_sim[idx_2]
-    rank_3 = cosine_sim[idx_3]
-    # Calculating the scores
-    score_series_1 = pd.Series(rank_1).sort_values(ascending = False)
-    score_series_2 = pd.Series(rank_2).sort_values(ascending = False)
-    score_series_3 = pd.Series(rank_3).sort_values(ascending = False)
-     # Appending the names of movies
-    listings = score_series_1.append(score_series_1).append(score_series_3).sort_values(ascending = False)
-    recommended_movies = []
-    # Choose top 50
-    top_50_indexes = list(listings.iloc[1:50].index)
-    # Removing chosen movies
-    top_indexes = np.setdiff1d(top_50_indexes,[idx_1,idx_2,idx_3])
-    for i in top_indexes[:top_n]:
-        recommended_movies.append(list(movies_df['title'])[i])
-    return recommended_movies
+    model_watcher.check()
+    catalogue = get_catalogue()
+    # Unknown titles are skipped; popular movies make up for them below
+    movie_list = catalogue.known_titles(movie_list)
+    seed_ids = catalogue.movie_ids_for_titles(movie_list)
+    if not movie_list:
+        recommended_movies = []
+    elif COLLAB_STRATEGY == 'neighbours':
+        recommended_movies = neighbourhood_model(movie_list, top_n)
+    elif COLLAB_STRATEGY == 'foldin':
+        recommended_movies = foldin_model(movie_list, top_n)
+    else:
+        recommended_movies = factor_model(movie_list, top_n)
+    return with_fallback(recommended_movies, catalogue, seed_ids, top_n)
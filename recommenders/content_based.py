@@ -28,17 +28,55 @@
 """
 
 # Script dependencies
-import os
-import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import CountVectorizer
-
-# Importing data
-movies = pd.read_csv('resources/data/movies.csv', sep = ',',delimiter=',')
-ratings = pd.read_csv('resources/data/ratings.csv')
-movies.dropna(inplace=True)
-
+from recommenders.content_features import load_or_build_features, source_signature
+from recommenders.factors import top_k
+from recommenders.neighbour_store import get_neighbour_store, merge_neighbours
+from recommenders.popularity import (get_candidate_ids, get_popularity,
+                                     with_fallback)
+from recommenders.popularity import source_signature as popularity_signature
+from utils.catalogue import load_catalogue
+from utils.data_loader import load_rating_columns
+from utils.instrumentation import timed
+from utils.lazy import ChangeWatcher, lazy_resource
+
+# Number of neighbours kept per chosen movie.
+DEFAULT_K = 100
+
+# Data and models are loaded on first use, see `utils.lazy`.
+@lazy_resource
+def get_catalogue():
+    """Movie catalogue shared with the other recommenders."""
+    return load_catalogue('resources/data/movies.csv')
+
+@lazy_resource
+def get_title_index():
+    """Index resolving the chosen titles, built with the catalogue rather
+    than on the first title missing from it."""
+    return get_catalogue().title_index
+
+@lazy_resource
+def get_content_features():
+    """Sparse TF-IDF features, aligned with the catalogue rows."""
+    return load_or_build_features(get_catalogue().movies)
+
+@lazy_resource
+def get_candidate_features():
+    """Features of the popular movies candidates are drawn from, see
+    `recommenders.popularity`."""
+    rows = get_catalogue().rows_for_movie_ids(get_candidate_ids().tolist())
+    return get_content_features().subset(np.sort(rows[rows >= 0]))
+
+# Changes to the catalogue or feature files are picked up by running
+# processes, as are new ratings, which change the popular candidates.
+catalogue_watcher = ChangeWatcher(
+    lambda: (source_signature(), popularity_signature()),
+    load_catalogue.cache_clear, load_rating_columns.cache_clear,
+    get_catalogue.reset, get_title_index.reset, get_content_features.reset,
+    get_popularity.reset, get_candidate_ids.reset,
+    get_candidate_features.reset, get_neighbour_store.reset)
+
+@timed()
 def data_preprocessing(subset_size):
     """Prepare data for use within Content filtering algorithm.
 
@@ -53,14 +91,52 @@ def data_preprocessing(subset_size):
         Subset of movies selected for content-based filtering.
 
     """
+    movies = get_catalogue().movies
     # Split genre data into individual words.
-    movies['keyWords'] = movies['genres'].str.replace('|', ' ')
+    keywords = movies['genres'].str.replace('|', ' ', regex=False)
     # Subset of the data
-    movies_subset = movies[:subset_size]
+    movies_subset = movies[:subset_size].assign(keyWords=keywords[:subset_size])
     return movies_subset
 
+@timed()
+def content_neighbours(movie_ids, k=DEFAULT_K):
+    """Content-based neighbour lists of several movies.
+
+    Parameters
+    ----------
+    movie_ids : array-like (int)
+        MovieLens Movie IDs.
+    k : int
+        Maximum number of neighbours per movie.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Neighbour Movie IDs (int32, padded with -1) and their similarity
+        (float32), one row per movie, most similar first.
+
+    """
+    features = get_content_features()
+    candidates = get_candidate_features()
+    rows = get_catalogue().rows_for_movie_ids(movie_ids)
+    neighbours = np.full((len(rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    known = np.flatnonzero(rows >= 0)
+    # Only the chosen movies are scored, against the popular candidates
+    similarity = features.similarity(rows[known], candidates)
+    for column, i in enumerate(known):
+        column_scores = similarity[:, column]
+        # A movie is never its own neighbour
+        column_scores[candidates.movie_ids == features.movie_ids[rows[i]]] = 0
+        best = top_k(column_scores, k)
+        best = best[column_scores[best] > 0]
+        neighbours[i, :len(best)] = candidates.movie_ids[best]
+        scores[i, :len(best)] = column_scores[best]
+    return neighbours, scores
+
 # !! DO NOT CHANGE THIS FUNCTION SIGNATURE !!
 # You are, however, encouraged to change its content.  
+@timed()
 def content_model(movie_list,top_n=10):
     """Performs Content filtering based upon a list of movies supplied
        by the app user.
@@ -78,35 +154,17 @@ def content_model(movie_list,top_n=10):
         Titles of the top-n movie recommendations to the user.
 
     """
-    # Initializing the empty list of recommended movies
-    recommended_movies = []
-    data = data_preprocessing(27000)
-    # Instantiating and generating the count matrix
-    count_vec = CountVectorizer()
-    count_matrix = count_vec.fit_transform(data['keyWords'])
-    indices = pd.Series(data['title'])
-    cosine_sim = cosine_similarity(count_matrix, count_matrix)
-    # Getting the index of the movie that matches the title
-    idx_1 = indices[indices == movie_list[0]].index[0]
-    idx_2 = indices[indices == movie_list[1]].index[0]
-    idx_3 = indices[indices == movie_list[2]].index[0]
-    # Creating a Series with the similarity scores in descending order
-    rank_1 = cosine_sim[idx_1]
-    rank_2 = cosine_sim[idx_2]
-    rank_3 = cosine_sim[idx_3]
-    # Calculating the scores
-    score_series_1 = pd.Series(rank_1).sort_values(ascending = False)
-    score_series_2 = pd.Series(rank_2).sort_values(ascending = False)
-    score_series_3 = pd.Series(rank_3).sort_values(ascending = False)
-    # Getting the indexes of the 10 most similar movies
-    listings = score_series_1.append(score_series_1).append(score_series_3).sort_values(ascending = False)
-
-    # Store movie names
-    recommended_movies = []
-    # Appending the names of movies
-    top_50_indexes = list(listings.iloc[1:50].index)
-    # Removing chosen movies
-    top_indexes = np.setdiff1d(top_50_indexes,[idx_1,idx_2,idx_3])
-    for i in top_indexes[:top_n]:
-        recommended_movies.append(list(movies['title'])[i])
-    return recommended_movies
+    catalogue_watcher.check()
+    catalogue = get_catalogue()
+    # Getting the Movie IDs of the chosen movies, skipping unknown titles
+    seed_ids = catalogue.movie_ids_for_titles(catalogue.known_titles(movie_list))
+    # Neighbour lists of the chosen movies, precomputed when available
+    neighbour_lists = get_neighbour_store().lookup('content', seed_ids, k=DEFAULT_K)
+    if neighbour_lists is None:
+        neighbour_lists = content_neighbours(seed_ids)
+    # Merging the lists, summing the similarity of candidates shared between
+    # several of them, and removing chosen movies
+    top_ids, _ = merge_neighbours(*neighbour_lists, exclude=seed_ids)
+    recommended_movies = catalogue.titles_for_movie_ids(top_ids[:top_n].tolist())
+    # Popular movies make up for unknown or poorly connected chosen movies
+    return with_fallback(recommended_movies, catalogue, seed_ids, top_n)
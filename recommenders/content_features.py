@@ -0,0 +1,462 @@
+"""
+
+    Sparse TF-IDF content features of the movie catalogue.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Each movie is described by tokens from several sources, each forming
+    a block of the feature matrix:
+
+    - `genre:<genre>` for every genre in `movies.csv`;
+    - `decade:<decade>` from the release year in the title;
+    - `tag:<tag>`, counted over user tags in `tags.csv`, if present;
+    - `genome:<tagId>`, weighted by relevance, for the tag genome scores
+      in `genome_scores.csv` above `GENOME_MIN_RELEVANCE`, if present.
+
+    Tag and genome files are read in chunks, so neither needs to fit in
+    memory. Counts are damped as 1 + log(count), every token is weighted
+    by its smoothed inverse document frequency, and each block is
+    L2-normalised and scaled by its weight in `BLOCK_WEIGHTS` before the
+    rows are normalised once more. The result is a float32 CSR matrix
+    whose row dot products are cosine similarities, so scoring the seed
+    movies of a request against the catalogue costs one sparse
+    matrix-vector product per seed.
+
+    The fitted matrix is persisted, and rebuilt when any source file
+    changes. Movies appended to `movies.csv` are transformed with the
+    fitted vocabulary and IDF weights and added to the matrix instead;
+    tokens first seen in them are ignored until the next rebuild. Rebuild
+    offline with:
+
+        python -m recommenders.content_features
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from utils.data_loader import file_signature, load_movies
+from utils.instrumentation import timed
+
+MOVIES_PATH = 'resources/data/movies.csv'
+TAGS_PATH = 'resources/data/tags.csv'
+GENOME_SCORES_PATH = 'resources/data/genome_scores.csv'
+FEATURES_PATH = 'resources/models/content_features.npz'
+
+# Feature blocks, in column order, and their weight in the similarity.
+BLOCKS = ('genre', 'decade', 'tag', 'genome')
+BLOCK_WEIGHTS = {'genre': 1.0, 'decade': 0.3, 'tag': 0.5, 'genome': 1.0}
+
+# Genome scores below this relevance are dropped.
+GENOME_MIN_RELEVANCE = 0.5
+
+# Number of CSV rows read at a time from the tag and genome files.
+CHUNK_SIZE = 1000000
+
+YEAR_PATTERN = re.compile(r'\((\d{4})\)\s*$')
+
+
+class ContentFeatures:
+    """L2-normalised TF-IDF features, one row per catalogue movie.
+
+    Parameters
+    ----------
+    movie_ids : np.ndarray (int32)
+        MovieLens Movie IDs, one per matrix row.
+    matrix : scipy.sparse.csr_matrix (float32)
+        Feature matrix of shape (n_movies, n_tokens), rows of unit norm
+        (or zero for movies without any token).
+    vocabulary : np.ndarray (str)
+        Token of each column, prefixed with its block.
+    idf : np.ndarray (float32)
+        Inverse document frequency of each column.
+    signature : str
+        Signatures of the source files the features were fitted on.
+
+    """
+
+    def __init__(self, movie_ids, matrix, vocabulary, idf, signature=''):
+        self.movie_ids = movie_ids
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.signature = signature
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def subset(self, rows):
+        """Features of some of the movies, sharing the vocabulary."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return ContentFeatures(self.movie_ids[rows], self.matrix[rows],
+                               self.vocabulary, self.idf, self.signature)
+
+    @timed('content_similarity')
+    def similarity(self, rows, candidates=None):
+        """Cosine similarity of every movie to some of them.
+
+        Parameters
+        ----------
+        rows : array-like (int)
+            Matrix rows of the query movies.
+        candidates : ContentFeatures, optional
+            Features of the movies scored, e.g. a `subset`; defaults to
+            every movie.
+
+        Returns
+        -------
+        np.ndarray (float32)
+            Similarities, shape (n_candidates, len(rows)).
+
+        """
+        candidates = self if candidates is None else candidates
+        queries = self.matrix[np.asarray(rows)].T.toarray()
+        return np.asarray(candidates.matrix @ queries, dtype=np.float32)
+
+    def save(self, path=FEATURES_PATH):
+        """Persist the features as a compressed `.npz` archive."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write to a temporary file first so readers never see a partial file.
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path,
+                            movie_ids=self.movie_ids,
+                            data=self.matrix.data,
+                            indices=self.matrix.indices,
+                            indptr=self.matrix.indptr,
+                            shape=np.array(self.matrix.shape),
+                            vocabulary=self.vocabulary,
+                            idf=self.idf,
+                            signature=np.array(self.signature))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=FEATURES_PATH):
+        """Load features previously written with `save`."""
+        with np.load(path, allow_pickle=False) as archive:
+            matrix = sp.csr_matrix((archive['data'], archive['indices'],
+                                    archive['indptr']),
+                                   shape=tuple(archive['shape']))
+            return cls(movie_ids=archive['movie_ids'],
+                       matrix=matrix,
+                       vocabulary=archive['vocabulary'],
+                       idf=archive['idf'],
+                       signature=str(archive['signature']))
+
+
+def source_signature(movies_path=MOVIES_PATH, tags_path=TAGS_PATH,
+                     genome_path=GENOME_SCORES_PATH):
+    """Signatures of the feature source files, None for missing ones."""
+    return json.dumps({path: file_signature(path) if os.path.exists(path) else None
+                       for path in (movies_path, tags_path, genome_path)},
+                      sort_keys=True)
+
+
+# ---------------------------------------------------------------------
+# Tokens, as (row, token, weight) triplets.
+# ---------------------------------------------------------------------
+
+def movie_tokens(movies):
+    """Genre and decade tokens of each movie.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        Movie records with `title` and `genres` columns, indexed by row
+        position.
+
+    Returns
+    -------
+    Pandas Dataframe
+        `row`, `token` and `weight` columns.
+
+    """
+    genres = movies['genres'].str.lower().str.split('|').explode()
+    genres = genres[genres != '(no genres listed)']
+    years = movies['title'].str.extract(YEAR_PATTERN, expand=False).dropna()
+    decades = 'decade:' + (years.astype(int) // 10 * 10).astype(str)
+    tokens = pd.concat([('genre:' + genres), decades])
+    return pd.DataFrame({'row': tokens.index.to_numpy(dtype=np.int64),
+                         'token': tokens.to_numpy(dtype=object),
+                         'weight': np.float32(1)})
+
+
+def _movie_rows(movies):
+    return pd.Index(movies['movieId'].to_numpy(dtype=np.int64))
+
+
+def tag_tokens(movies, path_to_tags=TAGS_PATH, chunk_size=CHUNK_SIZE):
+    """User tag counts of each movie, streamed from a tags file.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        Catalogue the rows refer to.
+    path_to_tags : str
+        Tags file, with `movieId` and `tag` columns.
+    chunk_size : int
+        Number of CSV rows read at a time.
+
+    Returns
+    -------
+    Pandas Dataframe
+        `row`, `token` and `weight` (count) columns.
+
+    """
+    index = _movie_rows(movies)
+    counts = []
+    for chunk in pd.read_csv(path_to_tags, usecols=['movieId', 'tag'],
+                             chunksize=chunk_size):
+        chunk = chunk.dropna()
+        rows = index.get_indexer(chunk['movieId'].to_numpy(dtype=np.int64))
+        tokens = 'tag:' + chunk['tag'].astype(str).str.strip().str.lower()
+        chunk = pd.DataFrame({'row': rows, 'token': tokens.to_numpy()})
+        # Unknown movies and empty tags are dropped.
+        chunk = chunk[(rows >= 0) & (tokens != 'tag:').to_numpy()]
+        # Aggregate each chunk, so only distinct (movie, tag) pairs are kept.
+        counts.append(chunk.groupby(['row', 'token']).size())
+    if not counts:
+        return pd.DataFrame(columns=['row', 'token', 'weight'])
+    counts = pd.concat(counts).groupby(level=[0, 1]).sum()
+    return pd.DataFrame({'row': counts.index.get_level_values(0),
+                         'token': counts.index.get_level_values(1),
+                         'weight': counts.to_numpy(dtype=np.float32)})
+
+
+def genome_tokens(movies, path_to_genome=GENOME_SCORES_PATH,
+                  min_relevance=GENOME_MIN_RELEVANCE, chunk_size=CHUNK_SIZE):
+    """Relevant genome tags of each movie, streamed from a scores file.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        Catalogue the rows refer to.
+    path_to_genome : str
+        Genome scores file, with `movieId`, `tagId` and `relevance` columns.
+    min_relevance : float
+        Scores below this relevance are dropped.
+    chunk_size : int
+        Number of CSV rows read at a time.
+
+    Returns
+    -------
+    Pandas Dataframe
+        `row`, `token` and `weight` (relevance) columns.
+
+    """
+    index = _movie_rows(movies)
+    parts = []
+    for chunk in pd.read_csv(path_to_genome,
+                             usecols=['movieId', 'tagId', 'relevance'],
+                             dtype={'movieId': np.int64, 'tagId': np.int64,
+                                    'relevance': np.float32},
+                             chunksize=chunk_size):
+        chunk = chunk[chunk['relevance'] >= min_relevance]
+        rows = index.get_indexer(chunk['movieId'].to_numpy())
+        chunk = chunk[rows >= 0]
+        parts.append(pd.DataFrame({'row': rows[rows >= 0],
+                                   'token': 'genome:' + chunk['tagId'].astype(str),
+                                   'weight': chunk['relevance'].to_numpy()}))
+    if not parts:
+        return pd.DataFrame(columns=['row', 'token', 'weight'])
+    return pd.concat(parts, ignore_index=True)
+
+
+def collect_tokens(movies, tags_path=TAGS_PATH, genome_path=GENOME_SCORES_PATH):
+    """Tokens of every block available for a catalogue."""
+    tokens = [movie_tokens(movies)]
+    if tags_path and os.path.exists(tags_path):
+        tokens.append(tag_tokens(movies, tags_path))
+    if genome_path and os.path.exists(genome_path):
+        tokens.append(genome_tokens(movies, genome_path))
+    return pd.concat(tokens, ignore_index=True)
+
+
+# ---------------------------------------------------------------------
+# Fitting and transforming.
+# ---------------------------------------------------------------------
+
+def _block_of(vocabulary):
+    """Position in `BLOCKS` of each token's block."""
+    return np.array([BLOCKS.index(token.split(':', 1)[0]) for token in vocabulary],
+                    dtype=np.int64)
+
+
+def _count_matrix(tokens, vocabulary, n_rows):
+    """Summed token weights over a vocabulary, unknown tokens dropped."""
+    columns = pd.Index(vocabulary).get_indexer(tokens['token'])
+    known = columns >= 0
+    return sp.csr_matrix((tokens['weight'].to_numpy(dtype=np.float32)[known],
+                          (tokens['row'].to_numpy()[known], columns[known])),
+                         shape=(n_rows, len(vocabulary)), dtype=np.float32)
+
+
+def transform(tokens, vocabulary, idf, n_rows):
+    """Weighted, normalised TF-IDF matrix of tokens.
+
+    Parameters
+    ----------
+    tokens : Pandas Dataframe
+        `row`, `token` and `weight` columns.
+    vocabulary : np.ndarray (str)
+        Fitted vocabulary, sorted by block.
+    idf : np.ndarray (float32)
+        Fitted inverse document frequencies.
+    n_rows : int
+        Number of movies.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix (float32)
+        Features with rows of unit norm.
+
+    """
+    matrix = _count_matrix(tokens, vocabulary, n_rows).tocoo()
+    blocks = _block_of(vocabulary)[matrix.col]
+    data = matrix.data
+    # Damp repeated tokens; genome relevances are already weights.
+    counted = blocks != BLOCKS.index('genome')
+    data[counted] = 1 + np.log(data[counted])
+    data *= idf[matrix.col]
+    # L2-normalise each block of each row, then weight the blocks.
+    cells = matrix.row.astype(np.int64) * len(BLOCKS) + blocks
+    norms = np.sqrt(np.bincount(cells, weights=data.astype(np.float64) ** 2,
+                                minlength=n_rows * len(BLOCKS)))
+    weights = np.array([BLOCK_WEIGHTS[block] for block in BLOCKS])
+    data = data / norms[cells] * weights[blocks]
+    matrix = sp.csr_matrix((data.astype(np.float32), (matrix.row, matrix.col)),
+                           shape=matrix.shape)
+    row_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    row_norms[row_norms == 0] = 1
+    return sp.csr_matrix(sp.diags(1 / row_norms).astype(np.float32) @ matrix)
+
+
+def fit_features(movies, tokens=None, signature=''):
+    """Fit the vocabulary and IDF weights of a catalogue, and transform it.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        Catalogue, indexed by row position.
+    tokens : Pandas Dataframe, optional
+        Tokens of the catalogue, by default from `collect_tokens`.
+    signature : str
+        Signature of the source files, stored alongside the features.
+
+    Returns
+    -------
+    ContentFeatures
+        Features aligned row-for-row with `movies`.
+
+    """
+    tokens = collect_tokens(movies) if tokens is None else tokens
+    vocabulary = np.array(sorted(set(tokens['token']),
+                                 key=lambda t: (BLOCKS.index(t.split(':', 1)[0]), t)),
+                          dtype=str)
+    counts = _count_matrix(tokens, vocabulary, len(movies))
+    document_frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+    idf = (np.log((1 + len(movies)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return ContentFeatures(movie_ids=movies['movieId'].to_numpy(dtype=np.int32),
+                           matrix=transform(tokens, vocabulary, idf, len(movies)),
+                           vocabulary=vocabulary,
+                           idf=idf,
+                           signature=signature)
+
+
+def extend_features(features, movies, signature=''):
+    """Add the movies appended to a catalogue to its features.
+
+    The new movies are transformed with the fitted vocabulary and IDF
+    weights, so existing rows are unchanged.
+
+    Parameters
+    ----------
+    features : ContentFeatures
+        Features of the first rows of `movies`.
+    movies : Pandas Dataframe
+        The grown catalogue.
+    signature : str
+        Signature of the source files, stored alongside the features.
+
+    Returns
+    -------
+    ContentFeatures
+        Features aligned row-for-row with `movies`.
+
+    """
+    n_old = len(features)
+    new_movies = movies[n_old:].reset_index(drop=True)
+    tokens = collect_tokens(new_movies)
+    matrix = transform(tokens, features.vocabulary, features.idf, len(new_movies))
+    return ContentFeatures(movie_ids=movies['movieId'].to_numpy(dtype=np.int32),
+                           matrix=sp.vstack([features.matrix, matrix], format='csr'),
+                           vocabulary=features.vocabulary,
+                           idf=features.idf,
+                           signature=signature)
+
+
+def _can_extend(features, movies, signature):
+    """Whether only movies were appended since the features were fitted."""
+    try:
+        old, new = json.loads(features.signature), json.loads(signature)
+    except ValueError:
+        return False
+    movie_ids = movies['movieId'].to_numpy(dtype=np.int32)
+    return (len(features) < len(movie_ids)
+            and np.array_equal(movie_ids[:len(features)], features.movie_ids)
+            and {p: s for p, s in old.items() if p != MOVIES_PATH}
+            == {p: s for p, s in new.items() if p != MOVIES_PATH})
+
+
+def load_or_build_features(movies, path=FEATURES_PATH):
+    """Load the persisted features, refitting them if missing or stale.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        The catalogue the features must describe.
+    path : str
+        Location of the persisted features.
+
+    Returns
+    -------
+    ContentFeatures
+        Features aligned row-for-row with `movies`.
+
+    """
+    signature = source_signature()
+    features = ContentFeatures.load(path) if os.path.exists(path) else None
+    if features is not None and features.signature == signature and len(features) == len(movies):
+        return features
+    if features is not None and _can_extend(features, movies, signature):
+        features = extend_features(features, movies, signature=signature)
+    else:
+        features = fit_features(movies, signature=signature)
+    features.save(path)
+    return features
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description='Refit the content-based TF-IDF features.')
+    parser.add_argument('--output', default=FEATURES_PATH,
+                        help='Where to write the features (.npz).')
+    args = parser.parse_args()
+
+    start = time.time()
+    content_features = fit_features(load_movies(MOVIES_PATH),
+                                    signature=source_signature())
+    content_features.save(args.output)
+    print('Fitted {} movies x {} tokens ({} non-zeros) in {:.1f}s -> {}'.format(
+        len(content_features), len(content_features.vocabulary),
+        content_features.matrix.nnz, time.time() - start, args.output))
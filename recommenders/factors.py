@@ -0,0 +1,371 @@
+"""
+
+    Vectorised scoring with trained matrix factorisation models.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Calling `model.predict` once per user is dominated by Python overhead.
+    The estimate of a biased SVD model is
+
+        r_ui = mu + b_u + b_i + q_i . p_u
+
+    so all users can be scored for an item with a single matrix-vector
+    product over the user factors `pu`. This module extracts the factor
+    arrays from a trained Surprise `SVD` model once, and scores them with
+    NumPy.
+
+    Factors are saved as a directory of `.npy` arrays that serving
+    processes memory-map, so every process shares the same pages. The
+    manifest, `meta.json`, records the format version, dimensions, and the
+    dtype, shape and SHA-256 checksum of each array; loading checks the
+    checksums unless told not to, which reads each array once. Updated models are published
+    as numbered snapshots under a common root, with a `CURRENT` file
+    naming the live one; replacing that file is atomic, so readers see
+    either the old or the new snapshot, never a partial one.
+
+    The recommenders never read the pickled Surprise model: it is
+    exported as a snapshot, once, with:
+
+        python -m recommenders.factors --model resources/models/SVD_algo.pkl
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import functools
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# Arrays making up a saved model, each stored as `<name>.npy`.
+FACTOR_ARRAYS = ('pu', 'qi', 'bu', 'bi', 'user_ids', 'item_ids')
+
+# Version of the saved layout; manifests without one predate checksums.
+FORMAT_VERSION = 1
+
+
+def file_checksum(path, block_size=1 << 20):
+    """SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SVDFactors:
+    """Factor arrays and id maps of a trained biased SVD model.
+
+    Parameters
+    ----------
+    pu : np.ndarray (float32)
+        User factors, shape (n_users, n_factors).
+    qi : np.ndarray (float32)
+        Item factors, shape (n_items, n_factors).
+    bu : np.ndarray (float32)
+        User biases, shape (n_users,).
+    bi : np.ndarray (float32)
+        Item biases, shape (n_items,).
+    global_mean : float
+        Mean rating of the training set.
+    user_ids : np.ndarray (int)
+        Raw user ID of each row of `pu`.
+    item_ids : np.ndarray (int)
+        Raw Movie ID of each row of `qi`.
+    rating_scale : tuple (float, float)
+        Lower and upper bound estimates are clipped to.
+
+    """
+
+    def __init__(self, pu, qi, bu, bi, global_mean, user_ids, item_ids,
+                 rating_scale=(0.5, 5.0)):
+        self.pu = pu
+        self.qi = qi
+        self.bu = bu
+        self.bi = bi
+        self.global_mean = float(global_mean)
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.rating_scale = tuple(rating_scale)
+        # Directory the factors were loaded from, if any.
+        self.path = None
+
+    @functools.cached_property
+    def user_rows(self):
+        """Raw user ID to factor row, built on first use."""
+        return {uid: row for row, uid in enumerate(self.user_ids.tolist())}
+
+    @functools.cached_property
+    def item_rows(self):
+        """Raw Movie ID to factor row, built on first use."""
+        return {iid: row for row, iid in enumerate(self.item_ids.tolist())}
+
+    @property
+    def n_factors(self):
+        return self.qi.shape[1]
+
+    @classmethod
+    def from_surprise(cls, model):
+        """Extract the factors of a trained Surprise `SVD` model.
+
+        Parameters
+        ----------
+        model : surprise.SVD
+            A fitted model, whose `trainset` attribute is still attached.
+
+        Returns
+        -------
+        SVDFactors
+            The model's factors, indexed by raw user and item IDs.
+
+        """
+        trainset = model.trainset
+        user_ids = np.array([trainset.to_raw_uid(u)
+                             for u in trainset.all_users()])
+        item_ids = np.array([trainset.to_raw_iid(i)
+                             for i in trainset.all_items()])
+        return cls(pu=np.asarray(model.pu, dtype=np.float32),
+                   qi=np.asarray(model.qi, dtype=np.float32),
+                   bu=np.asarray(model.bu, dtype=np.float32),
+                   bi=np.asarray(model.bi, dtype=np.float32),
+                   global_mean=trainset.global_mean,
+                   user_ids=user_ids,
+                   item_ids=item_ids,
+                   rating_scale=trainset.rating_scale)
+
+    def save(self, path):
+        """Save the factors as a directory of `.npy` arrays.
+
+        Parameters
+        ----------
+        path : str
+            Directory to write. The arrays are written first and the
+            manifest, `meta.json`, last, so a directory with a manifest
+            is complete.
+
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {}
+        for name in FACTOR_ARRAYS:
+            array = np.ascontiguousarray(getattr(self, name))
+            tmp_path = os.path.join(path, name + '.tmp.npy')
+            np.save(tmp_path, array)
+            arrays[name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                            'sha256': file_checksum(tmp_path)}
+            os.replace(tmp_path, os.path.join(path, name + '.npy'))
+        meta = {'format_version': FORMAT_VERSION,
+                'global_mean': self.global_mean,
+                'rating_scale': list(self.rating_scale),
+                'n_users': len(self.user_ids), 'n_items': len(self.item_ids),
+                'n_factors': self.n_factors, 'arrays': arrays}
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', verify=True):
+        """Load factors saved with `save`.
+
+        Parameters
+        ----------
+        path : str
+            Directory written by `save`.
+        mmap_mode : str, optional
+            Memory-map mode of the arrays; the default maps them
+            read-only, so processes loading the same model share pages.
+        verify : bool
+            Whether to check the arrays against the manifest's checksums,
+            which reads them in full; dtypes and shapes are always
+            checked.
+
+        Returns
+        -------
+        SVDFactors
+            The loaded factors.
+
+        Raises
+        ------
+        ValueError
+            If the format version is unsupported, or an array does not
+            match the manifest.
+
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        version = meta.get('format_version', 0)
+        if version > FORMAT_VERSION:
+            raise ValueError('unsupported factor format version {} in {}'
+                             .format(version, path))
+        arrays = {name: np.load(os.path.join(path, name + '.npy'),
+                                mmap_mode=mmap_mode)
+                  for name in FACTOR_ARRAYS}
+        for name, expected in meta.get('arrays', {}).items():
+            array = arrays[name]
+            if (array.dtype.str != expected['dtype']
+                    or list(array.shape) != expected['shape']):
+                raise ValueError('{}.npy in {} does not match its manifest'
+                                 .format(name, path))
+            if (verify and file_checksum(os.path.join(path, name + '.npy'))
+                    != expected['sha256']):
+                raise ValueError('checksum mismatch for {}.npy in {}'
+                                 .format(name, path))
+        factors = cls(global_mean=meta['global_mean'],
+                      rating_scale=meta['rating_scale'], **arrays)
+        factors.path = path
+        return factors
+
+    def lookup_users(self, user_ids):
+        """Map raw user IDs to factor rows, with -1 for unknown users."""
+        return np.array([self.user_rows.get(uid, -1) for uid in user_ids],
+                        dtype=np.int64)
+
+    def score_users(self, item_id, user_rows):
+        """Estimate the rating every given user would give an item.
+
+        Mirrors `surprise.SVD.estimate`: the user bias is only added for
+        known users, the item bias only for known items, and the factor
+        product only when both are known.
+
+        Parameters
+        ----------
+        item_id : int
+            A raw Movie ID.
+        user_rows : np.ndarray (int)
+            Factor rows of the users to score, -1 for unknown users.
+
+        Returns
+        -------
+        np.ndarray (float32)
+            Estimated ratings, aligned with `user_rows`.
+
+        """
+        known = user_rows >= 0
+        rows = user_rows[known]
+        scores = np.full(len(user_rows), self.global_mean, dtype=np.float32)
+        scores[known] += self.bu[rows]
+        item_row = self.item_rows.get(item_id)
+        if item_row is not None:
+            scores += self.bi[item_row]
+            scores[known] += self.pu[rows] @ self.qi[item_row]
+        return np.clip(scores, *self.rating_scale, out=scores)
+
+
+def current_snapshot(root):
+    """Directory of the live snapshot under `root`, or None if there is none."""
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, version)
+
+
+def publish_snapshot(factors, root, keep=3):
+    """Save factors as a new snapshot and make it the live one.
+
+    Parameters
+    ----------
+    factors : SVDFactors
+        Factors to publish.
+    root : str
+        Directory holding the snapshots.
+    keep : int
+        Number of most recent snapshots kept on disk; older ones are
+        deleted. Processes still mapping them keep their pages.
+
+    Returns
+    -------
+    str
+        Directory of the new snapshot.
+
+    """
+    os.makedirs(root, exist_ok=True)
+    versions = sorted(name for name in os.listdir(root)
+                      if name.startswith('v') and name[1:].isdigit())
+    version = 'v{:04d}'.format(int(versions[-1][1:]) + 1 if versions else 1)
+    path = os.path.join(root, version)
+    factors.save(path)
+    tmp_path = os.path.join(root, 'CURRENT.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, 'CURRENT'))
+    for old in (versions + [version])[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return path
+
+
+def export_model(model_path, root):
+    """Publish the factors of a pickled Surprise `SVD` model as a snapshot.
+
+    Parameters
+    ----------
+    model_path : str
+        Pickled, fitted Surprise `SVD` model with its trainset attached.
+    root : str
+        Directory holding the snapshots.
+
+    Returns
+    -------
+    str
+        Directory of the new snapshot.
+
+    """
+    import pickle
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    return publish_snapshot(SVDFactors.from_surprise(model), root)
+
+
+def top_k(scores, k):
+    """Positions of the k highest scores, best first.
+
+    Uses a partition so only the selected positions are sorted. Ties are
+    broken on position, so results are deterministic.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        Scores to rank.
+    k : int
+        Number of positions to return.
+
+    Returns
+    -------
+    np.ndarray (int)
+        Positions into `scores`.
+
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = -np.partition(-scores, k - 1)[k - 1]
+    # Every score above the k-th best, then the first positions tied with it.
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[:k - len(above)]
+    top = np.concatenate([above, tied])
+    return top[np.lexsort((top, -scores[top]))]
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description='Export a pickled Surprise SVD model as a factor snapshot.')
+    parser.add_argument('--model', default='resources/models/SVD_algo.pkl',
+                        help='Pickled Surprise SVD model.')
+    parser.add_argument('--output', default='resources/models/svd_factors',
+                        help='Directory holding the factor snapshots.')
+    args = parser.parse_args()
+
+    start = time.time()
+    snapshot = export_model(args.model, args.output)
+    SVDFactors.load(snapshot)
+    print('Exported {} in {:.1f}s -> {}'.format(
+        args.model, time.time() - start, snapshot))
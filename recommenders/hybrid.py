@@ -0,0 +1,166 @@
+"""
+
+    Hybrid recommender blending content and collaborative scores.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Candidates are the union of the content-based neighbours and the SVD
+    factor neighbours of the chosen movies, at most `DEFAULT_K` of each
+    per chosen movie, read from the precomputed store when available and
+    computed otherwise. Every candidate is then scored under both
+    algorithms: its cosine similarity to the chosen movies is summed over
+    the TF-IDF features and over the SVD item factors. Each algorithm's
+    scores are min-max normalised over the candidates and blended with
+    the weights in `HYBRID_WEIGHTS`.
+
+    A request therefore costs one candidate generation per algorithm
+    (store lookups when precomputed) plus two products of at most
+    `2 * DEFAULT_K` candidate rows per chosen movie with the chosen
+    movies, instead of scoring the catalogue twice.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import numpy as np
+from recommenders import collaborative_based, content_based
+from recommenders.factors import top_k
+from recommenders.neighbour_store import get_neighbour_store
+from recommenders.popularity import with_fallback
+from utils.instrumentation import timed
+
+# Number of neighbours considered per chosen movie and algorithm.
+DEFAULT_K = 100
+
+# Weight of each algorithm in the blended score.
+HYBRID_WEIGHTS = {'content': 0.4, 'collab': 0.6}
+
+
+def _normalise(scores):
+    """Min-max scale scores to [0, 1]; constant scores map to 1."""
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def candidates(seed_ids, k=DEFAULT_K):
+    """Candidate movies for the chosen movies.
+
+    Parameters
+    ----------
+    seed_ids : np.ndarray (int)
+        Movie IDs of the chosen movies.
+    k : int
+        Maximum number of neighbours per chosen movie and algorithm.
+
+    Returns
+    -------
+    np.ndarray (int)
+        Sorted candidate Movie IDs, seeds excluded: the content-based
+        and the SVD factor neighbours of the chosen movies.
+
+    """
+    content_lists = get_neighbour_store().lookup('content', seed_ids, k=k)
+    if content_lists is None:
+        content_lists = content_based.content_neighbours(seed_ids, k=k)
+    collab_lists = collaborative_based.neighbour_lists(seed_ids, 'factors', k=k)
+    movie_ids = np.union1d(content_lists[0], collab_lists[0])
+    return movie_ids[(movie_ids >= 0) & ~np.isin(movie_ids, seed_ids)]
+
+
+def content_scores(seed_ids, movie_ids):
+    """Summed cosine similarity of movies to the chosen movies over the
+    content-based features; movies without features score 0."""
+    features = content_based.get_content_features()
+    catalogue = content_based.get_catalogue()
+    # Python ints hash much faster than NumPy scalars in the ID lookups
+    seed_rows = catalogue.rows_for_movie_ids(np.asarray(seed_ids).tolist())
+    rows = catalogue.rows_for_movie_ids(np.asarray(movie_ids).tolist())
+    scores = np.zeros(len(rows))
+    known = rows >= 0
+    # Summed cosines are cosines with the sum of the chosen movies' rows
+    query = np.asarray(features.matrix[seed_rows[seed_rows >= 0]].sum(axis=0)).ravel()
+    scores[known] = features.matrix[rows[known]] @ query
+    return scores
+
+
+def collab_scores(seed_ids, movie_ids):
+    """Summed cosine similarity of movies to the chosen movies over the
+    SVD item factors; movies unknown to the model score lowest."""
+    item_rows = collaborative_based.get_factors().item_rows
+    vectors = collaborative_based.get_factor_index().vectors
+    seed_rows = [item_rows[i] for i in np.asarray(seed_ids).tolist() if i in item_rows]
+    rows = np.array([item_rows.get(i, -1) for i in np.asarray(movie_ids).tolist()],
+                    dtype=np.int64)
+    known = rows >= 0
+    scores = np.zeros(len(rows))
+    if seed_rows and known.any():
+        scores[known] = vectors[rows[known]] @ vectors[seed_rows].sum(axis=0)
+        scores[~known] = scores[known].min()
+    return scores
+
+
+def blend(movie_ids, scores, weights=None):
+    """Blend the normalised scores of several algorithms.
+
+    Parameters
+    ----------
+    movie_ids : np.ndarray (int)
+        Candidate Movie IDs.
+    scores : dict
+        Algorithm name to scores, aligned with `movie_ids`.
+    weights : dict, optional
+        Algorithm name to weight, defaults to `HYBRID_WEIGHTS`.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Candidate Movie IDs, best first, and their blended scores. Ties
+        are broken on position in `movie_ids`.
+
+    """
+    weights = weights or HYBRID_WEIGHTS
+    blended = np.zeros(len(movie_ids))
+    for name, values in scores.items():
+        blended += weights.get(name, 0) * _normalise(np.asarray(values, dtype=np.float64))
+    order = top_k(blended, len(blended))
+    return np.asarray(movie_ids)[order], blended[order]
+
+
+@timed()
+def hybrid_model(movie_list, top_n=10, weights=None):
+    """Performs hybrid filtering based upon a list of movies supplied
+       by the app user.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+    weights : dict, optional
+        Weight of the 'content' and 'collab' scores, defaults to
+        `HYBRID_WEIGHTS`.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    content_based.catalogue_watcher.check()
+    collaborative_based.model_watcher.check()
+    catalogue = content_based.get_catalogue()
+    seed_ids = catalogue.movie_ids_for_titles(catalogue.known_titles(movie_list))
+    movie_ids = candidates(seed_ids)
+    top_ids, _ = blend(movie_ids, {'content': content_scores(seed_ids, movie_ids),
+                                   'collab': collab_scores(seed_ids, movie_ids)},
+                       weights)
+    recommended_movies = catalogue.titles_for_movie_ids(top_ids.tolist())[:top_n]
+    return with_fallback(recommended_movies, catalogue, seed_ids, top_n)
@@ -0,0 +1,179 @@
+"""
+
+    On-disk store of precomputed per-movie neighbour lists.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Recommendations for three seed movies are built by merging one
+    neighbour list per seed: candidates are ranked by the sum of their
+    scores across the seeds' lists. For the movies the app lets users
+    choose from, these lists are precomputed offline by
+    `recommenders.precompute` and stored here, one section per algorithm,
+    so serving a request becomes a lookup and a merge.
+
+    A store records the signatures of the data and model files it was
+    computed from, and is ignored once any of them change.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import json
+import os
+import warnings
+import numpy as np
+from recommenders import popularity
+from utils.data_loader import file_signature
+from utils.instrumentation import increment
+from utils.lazy import lazy_resource
+
+STORE_PATH = 'resources/models/neighbours.npz'
+
+# Files whose contents determine the neighbour lists.
+SOURCE_FILES = ('resources/data/movies.csv',
+                'resources/data/ratings.csv',
+                'resources/data/tags.csv',
+                'resources/data/genome_scores.csv',
+                'resources/models/svd_factors/CURRENT')
+
+
+def source_signatures(paths=SOURCE_FILES):
+    """Signatures of the files a store is computed from, and of the
+    candidate pruning settings lists are drawn with."""
+    signatures = {path: file_signature(path) if os.path.exists(path) else None
+                  for path in paths}
+    signatures['candidates'] = '{}:{}'.format(popularity.MIN_RATINGS,
+                                              popularity.CANDIDATE_POOL)
+    return signatures
+
+
+def merge_neighbours(neighbours, scores, exclude=()):
+    """Rank candidates by their summed score over several neighbour lists.
+
+    Parameters
+    ----------
+    neighbours : np.ndarray (int)
+        Candidate IDs, one row per seed, padded with -1.
+    scores : np.ndarray (float)
+        Score of each candidate, aligned with `neighbours`.
+    exclude : array-like (int)
+        IDs never returned, typically the seeds themselves.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Candidate IDs, best first, and their summed scores. Ties are
+        broken on ID, so results are deterministic.
+
+    """
+    neighbours = np.asarray(neighbours).ravel()
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    valid = neighbours >= 0
+    ids, positions = np.unique(neighbours[valid], return_inverse=True)
+    totals = np.bincount(positions, weights=scores[valid], minlength=len(ids))
+    keep = ~np.isin(ids, exclude)
+    ids, totals = ids[keep], totals[keep]
+    order = np.lexsort((ids, -totals))
+    return ids[order], totals[order]
+
+
+class NeighbourStore:
+    """Precomputed neighbour lists, one section per algorithm.
+
+    Parameters
+    ----------
+    sections : dict
+        Algorithm name to a tuple of sorted seed Movie IDs (int32), their
+        neighbour Movie IDs (int32, padded with -1) and scores (float32).
+    sources : dict
+        Signatures of the files the lists were computed from.
+
+    """
+
+    def __init__(self, sections=None, sources=None):
+        self.sections = sections or {}
+        self.sources = sources or {}
+
+    def __contains__(self, algorithm):
+        return algorithm in self.sections
+
+    def lookup(self, algorithm, movie_ids, k=None):
+        """Neighbour lists of several seed movies.
+
+        Parameters
+        ----------
+        algorithm : str
+            Section to read from.
+        movie_ids : array-like (int)
+            Seed Movie IDs.
+        k : int, optional
+            Number of neighbours per list the caller expects. Lists of
+            another length merge into other rankings, so the section is
+            then treated as missing, and counted in the
+            `neighbour_store_length_mismatches` counter.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray) or None
+            Neighbour IDs and scores, one row per seed, or None when the
+            section or any of the seeds is missing.
+
+        """
+        if algorithm not in self.sections:
+            return None
+        seed_ids, neighbours, scores = self.sections[algorithm]
+        if k is not None and neighbours.shape[1] != k:
+            # Usually a store precomputed with another `-k`; every lookup
+            # then falls back to online computation, so make it visible.
+            increment('neighbour_store_length_mismatches')
+            warnings.warn('{} lists in the neighbour store hold {} neighbours, '
+                          'not {}; recompute them with recommenders.precompute'
+                          .format(algorithm, neighbours.shape[1], k),
+                          RuntimeWarning)
+            return None
+        movie_ids = np.asarray(movie_ids)
+        positions = np.searchsorted(seed_ids, movie_ids)
+        positions = np.minimum(positions, len(seed_ids) - 1)
+        if len(seed_ids) == 0 or not np.all(seed_ids[positions] == movie_ids):
+            return None
+        return neighbours[positions], scores[positions]
+
+    def save(self, path=STORE_PATH):
+        """Persist the store as a compressed `.npz` archive."""
+        arrays = {}
+        for algorithm, (seed_ids, neighbours, scores) in self.sections.items():
+            arrays[algorithm + '.seed_ids'] = seed_ids
+            arrays[algorithm + '.neighbours'] = neighbours
+            arrays[algorithm + '.scores'] = scores
+        arrays['sources'] = np.array(json.dumps(self.sources))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STORE_PATH):
+        """Load a store previously written with `save`."""
+        with np.load(path, allow_pickle=False) as archive:
+            sources = json.loads(str(archive['sources']))
+            algorithms = {name.split('.')[0] for name in archive.files
+                          if name.endswith('.seed_ids')}
+            sections = {algorithm: (archive[algorithm + '.seed_ids'],
+                                    archive[algorithm + '.neighbours'],
+                                    archive[algorithm + '.scores'])
+                        for algorithm in algorithms}
+        return cls(sections, sources)
+
+
+@lazy_resource
+def get_neighbour_store():
+    """The persisted store, or an empty one if it is missing or stale."""
+    if not os.path.exists(STORE_PATH):
+        return NeighbourStore()
+    store = NeighbourStore.load(STORE_PATH)
+    if store.sources != source_signatures():
+        return NeighbourStore()
+    return store
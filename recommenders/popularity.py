@@ -0,0 +1,230 @@
+"""
+
+    Popularity table of the catalogue, for candidate pruning and fallback.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Most catalogue movies have only a handful of ratings. This table
+    counts the ratings of every catalogue movie in `ratings.csv` and
+    scores it with a Bayesian average, which shrinks the mean rating of
+    rarely rated movies towards the global mean:
+
+        score = (PRIOR_COUNT * global_mean + sum of ratings)
+                / (PRIOR_COUNT + n_ratings)
+
+    The recommenders use it twice:
+
+    - candidates are pruned to the `CANDIDATE_POOL` best scored movies
+      with at least `MIN_RATINGS` ratings before similarity scoring, so a
+      request scores fewer, better known movies;
+    - when the chosen movies are unknown, or give fewer than the requested
+      number of recommendations, the list is topped up with the best
+      scored movies instead of failing.
+
+    The table is persisted next to the models and rebuilt when the movies
+    or ratings change. To rebuild it offline:
+
+        python -m recommenders.popularity
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import json
+import os
+import numpy as np
+from recommenders.factors import top_k
+from utils.catalogue import load_catalogue
+from utils.data_loader import file_signature, load_rating_columns
+from utils.lazy import lazy_resource
+
+MOVIES_PATH = 'resources/data/movies.csv'
+RATINGS_PATH = 'resources/data/ratings.csv'
+POPULARITY_PATH = 'resources/models/popularity.npz'
+
+# Weight of the global mean in a movie's score, in ratings.
+PRIOR_COUNT = 20
+# Minimum number of ratings of a candidate movie. Movies rated by a
+# handful of users have unreliable factors and similarities, and would
+# otherwise crowd the top of collaborative lists.
+MIN_RATINGS = 20
+# Number of best scored movies kept as candidates.
+CANDIDATE_POOL = 5000
+
+
+def source_signature(movies_path=MOVIES_PATH, ratings_path=RATINGS_PATH):
+    """Signature of the files the table is computed from."""
+    return json.dumps({path: file_signature(path)
+                       for path in (movies_path, ratings_path)}, sort_keys=True)
+
+
+class PopularityTable:
+    """Rating counts and Bayesian-averaged scores of the catalogue movies.
+
+    Parameters
+    ----------
+    movie_ids : np.ndarray (int32)
+        Catalogue Movie IDs.
+    counts : np.ndarray (int32)
+        Number of ratings of each movie.
+    scores : np.ndarray (float32)
+        Bayesian-averaged rating of each movie.
+    signature : str
+        Signature of the source files, see `source_signature`.
+
+    """
+
+    def __init__(self, movie_ids, counts, scores, signature=''):
+        self.movie_ids = movie_ids
+        self.counts = counts
+        self.scores = scores
+        self.signature = signature
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @classmethod
+    def from_ratings(cls, ratings, movie_ids, prior_count=PRIOR_COUNT,
+                     signature=''):
+        """Count and score the ratings of the given movies.
+
+        Parameters
+        ----------
+        ratings : Pandas Dataframe or dict
+            Ratings with `movieId` and `rating` columns, e.g. the arrays
+            of `load_rating_columns`.
+        movie_ids : np.ndarray (int)
+            Movie IDs to score; ratings of other movies are ignored.
+        prior_count : float
+            Weight of the global mean in each score, in ratings.
+        signature : str
+            Signature of the source files.
+
+        Returns
+        -------
+        PopularityTable
+            The table, aligned with `movie_ids`.
+
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int32)
+        rated = np.asarray(ratings['movieId'])
+        values = np.asarray(ratings['rating'], dtype=np.float64)
+        order = np.argsort(movie_ids)
+        positions = np.minimum(np.searchsorted(movie_ids, rated, sorter=order),
+                               len(movie_ids) - 1)
+        known = movie_ids[order[positions]] == rated
+        columns = order[positions[known]]
+        counts = np.bincount(columns, minlength=len(movie_ids))
+        totals = np.bincount(columns, weights=values[known], minlength=len(movie_ids))
+        global_mean = values[known].mean() if known.any() else 0.0
+        scores = (prior_count * global_mean + totals) / (prior_count + counts)
+        return cls(movie_ids, counts.astype(np.int32), scores.astype(np.float32),
+                   signature)
+
+    def top(self, n, exclude=(), min_ratings=MIN_RATINGS):
+        """Movie IDs of the best scored movies.
+
+        Parameters
+        ----------
+        n : int
+            Maximum number of movies returned.
+        exclude : array-like (int)
+            Movie IDs never returned, e.g. the chosen movies.
+        min_ratings : int
+            Minimum number of ratings of a returned movie.
+
+        Returns
+        -------
+        np.ndarray (int32)
+            Movie IDs, best first. Ties are broken on catalogue order.
+
+        """
+        eligible = np.flatnonzero((self.counts >= min_ratings)
+                                  & ~np.isin(self.movie_ids, exclude))
+        best = eligible[top_k(self.scores[eligible], n)]
+        return self.movie_ids[best]
+
+    def save(self, path=POPULARITY_PATH):
+        """Persist the table as a `.npz` archive."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, movie_ids=self.movie_ids, counts=self.counts,
+                 scores=self.scores, signature=np.array(self.signature))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=POPULARITY_PATH):
+        """Load a table previously written with `save`."""
+        with np.load(path, allow_pickle=False) as archive:
+            return cls(archive['movie_ids'], archive['counts'],
+                       archive['scores'], str(archive['signature']))
+
+
+def load_or_build_popularity(path=POPULARITY_PATH, ratings_path=RATINGS_PATH):
+    """Load the persisted table, rebuilding it if missing or stale."""
+    signature = source_signature(ratings_path=ratings_path)
+    if os.path.exists(path):
+        table = PopularityTable.load(path)
+        if table.signature == signature:
+            return table
+    table = PopularityTable.from_ratings(
+        load_rating_columns(ratings_path, columns=('movieId', 'rating')),
+        load_catalogue(MOVIES_PATH).movie_ids, signature=signature)
+    table.save(path)
+    return table
+
+
+@lazy_resource
+def get_popularity():
+    """Popularity table of the catalogue."""
+    return load_or_build_popularity(POPULARITY_PATH, RATINGS_PATH)
+
+
+@lazy_resource
+def get_candidate_ids():
+    """Sorted Movie IDs of the movies recommenders score."""
+    return np.sort(get_popularity().top(CANDIDATE_POOL, min_ratings=MIN_RATINGS))
+
+
+def with_fallback(titles, catalogue, seed_ids, top_n):
+    """Top up recommendations with the best scored movies.
+
+    Parameters
+    ----------
+    titles : list (str)
+        Recommended titles, best first; may be empty.
+    catalogue : Catalogue
+        Movie catalogue the titles come from.
+    seed_ids : array-like (int)
+        Movie IDs of the chosen movies, never recommended.
+    top_n : int
+        Number of recommendations wanted.
+
+    Returns
+    -------
+    list (str)
+        `titles`, followed by popular movies until there are `top_n`.
+
+    """
+    titles = list(titles[:top_n])
+    if len(titles) >= top_n:
+        return titles
+    exclude = np.concatenate([np.asarray(seed_ids, dtype=np.int64),
+                              catalogue.movie_ids_for_titles(titles)])
+    popular = get_popularity().top(top_n - len(titles), exclude=exclude)
+    return titles + catalogue.titles_for_movie_ids(popular.tolist())
+
+
+if __name__ == '__main__':
+    import time
+
+    start = time.time()
+    if os.path.exists(POPULARITY_PATH):
+        os.remove(POPULARITY_PATH)
+    popularity = load_or_build_popularity()
+    print('Scored {} movies ({} rated) in {:.1f}s -> {}'.format(
+        len(popularity), int((popularity.counts > 0).sum()),
+        time.time() - start, POPULARITY_PATH))
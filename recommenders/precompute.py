@@ -0,0 +1,144 @@
+"""
+
+    Batch job precomputing neighbour lists for the selectable movies.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    The app only offers a few hundred movies to choose from (see
+    `SEED_SLICES`), so the neighbour lists needed to answer any request
+    are a small, known set. This job computes the content-based and
+    collaborative lists of each of those movies across a process pool,
+    and writes them to the store read by `content_model` and
+    `collab_model`. Run it on a schedule, or after the data or model
+    change:
+
+        python -m recommenders.precompute
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import multiprocessing
+import time
+import numpy as np
+from recommenders import collaborative_based, content_based
+from recommenders.neighbour_store import (STORE_PATH, NeighbourStore,
+                                          source_signatures)
+from utils.catalogue import load_catalogue
+from utils.data_loader import load_movie_titles
+
+# Slices of the title list offered by the app's three movie selectors.
+SEED_SLICES = (slice(14930, 15200), slice(25055, 25255), slice(21100, 21200))
+
+# Number of neighbours kept per movie; the recommenders ignore lists of
+# any other length, see `NeighbourStore.lookup`.
+DEFAULT_K = collaborative_based.DEFAULT_K
+
+
+def selectable_movie_ids(path_to_movies='resources/data/movies.csv'):
+    """Movie IDs of every movie the app lets users choose.
+
+    Parameters
+    ----------
+    path_to_movies : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+
+    Returns
+    -------
+    np.ndarray (int32)
+        Sorted, unique Movie IDs.
+
+    """
+    titles = load_movie_titles(path_to_movies)
+    selectable = [title for part in SEED_SLICES for title in titles[part]]
+    catalogue = load_catalogue(path_to_movies)
+    return np.unique(catalogue.movie_ids_for_titles(selectable))
+
+
+def _compute_lists(task):
+    """Neighbour lists of a chunk of movies, run inside a pool worker."""
+    algorithm, movie_ids, k = task
+    if algorithm == 'content':
+        return content_based.content_neighbours(movie_ids, k=k)
+    return collaborative_based.collab_neighbours(movie_ids, k=k,
+                                                 strategy=algorithm)
+
+
+def build_store(movie_ids, algorithms=('content', 'factors', 'neighbours'),
+                k=DEFAULT_K, processes=None, chunk_size=32):
+    """Compute the neighbour lists of several movies.
+
+    Parameters
+    ----------
+    movie_ids : np.ndarray (int)
+        Sorted, unique Movie IDs of the seed movies.
+    algorithms : tuple (str)
+        Sections to compute: 'content', and the collaborative strategies
+        'factors' and 'neighbours'.
+    k : int
+        Maximum number of neighbours per movie.
+    processes : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+    chunk_size : int
+        Number of movies handed to a worker at a time.
+
+    Returns
+    -------
+    NeighbourStore
+        The computed lists.
+
+    """
+    movie_ids = np.asarray(movie_ids, dtype=np.int32)
+    sources = source_signatures()
+    # Load models once in the parent, so forked workers share them.
+    content_based.get_content_features()
+    collaborative_based.get_factor_index()
+    collaborative_based.get_rating_matrix()
+    collaborative_based.get_users()
+    chunks = [movie_ids[start:start + chunk_size]
+              for start in range(0, len(movie_ids), chunk_size)]
+    sections = {}
+    with multiprocessing.Pool(processes) as pool:
+        for algorithm in algorithms:
+            results = pool.map(_compute_lists,
+                               [(algorithm, chunk, k) for chunk in chunks])
+            neighbours = np.concatenate([r[0] for r in results])
+            scores = np.concatenate([r[1] for r in results])
+            sections[algorithm] = (movie_ids, neighbours.astype(np.int32),
+                                   scores.astype(np.float32))
+    return NeighbourStore(sections, sources)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Precompute neighbour lists of the selectable movies.')
+    parser.add_argument('--all', action='store_true',
+                        help='Precompute every movie in the catalogue.')
+    parser.add_argument('-k', type=int, default=DEFAULT_K,
+                        help='Number of neighbours to keep per movie.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes.')
+    parser.add_argument('--algorithms', nargs='+',
+                        default=['content', 'factors', 'neighbours'],
+                        help='Sections to compute.')
+    parser.add_argument('--output', default=STORE_PATH,
+                        help='Where to write the store (.npz).')
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.all:
+        seeds = np.unique(load_catalogue('resources/data/movies.csv').movie_ids)
+    else:
+        seeds = selectable_movie_ids()
+    store = build_store(seeds, algorithms=args.algorithms, k=args.k,
+                        processes=args.processes)
+    store.save(args.output)
+    print('Precomputed {} movies x {} in {:.1f}s -> {}'.format(
+        len(seeds), ', '.join(args.algorithms), time.time() - start,
+        args.output))
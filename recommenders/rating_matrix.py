@@ -0,0 +1,128 @@
+"""
+
+    Sparse user x item rating matrix for neighbourhood-based filtering.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    The ratings are held in a CSR matrix with one row per user and one
+    column per movie, built once together with maps from raw user and
+    Movie IDs to rows and columns. Slicing the ratings of a neighbourhood
+    of users then costs O(nnz) of those users, instead of a boolean scan
+    of the whole ratings table per user.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import numpy as np
+import scipy.sparse as sp
+from utils.instrumentation import timed
+
+
+class RatingMatrix:
+    """CSR user x item ratings with raw ID maps.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_matrix (float32)
+        Ratings, shape (n_users, n_items).
+    user_ids : np.ndarray (int)
+        Raw user ID of each row, sorted.
+    item_ids : np.ndarray (int)
+        Raw Movie ID of each column, sorted.
+
+    """
+
+    def __init__(self, matrix, user_ids, item_ids):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.user_index = {uid: row for row, uid in enumerate(user_ids.tolist())}
+        self.item_index = {iid: col for col, iid in enumerate(item_ids.tolist())}
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def from_ratings(cls, ratings):
+        """Build the matrix from rating records.
+
+        Parameters
+        ----------
+        ratings : Pandas Dataframe or dict
+            Ratings with `userId`, `movieId` and `rating` columns, e.g.
+            the arrays of `load_rating_columns`.
+
+        Returns
+        -------
+        RatingMatrix
+            The ratings in CSR form.
+
+        """
+        user_ids, user_rows = np.unique(np.asarray(ratings['userId']),
+                                        return_inverse=True)
+        item_ids, item_cols = np.unique(np.asarray(ratings['movieId']),
+                                        return_inverse=True)
+        matrix = sp.csr_matrix(
+            (np.asarray(ratings['rating'], dtype=np.float32),
+             (user_rows, item_cols)),
+            shape=(len(user_ids), len(item_ids)), dtype=np.float32)
+        return cls(matrix, user_ids, item_ids)
+
+    def user_rows(self, user_ids):
+        """Row positions of raw user IDs, with -1 for unknown users."""
+        return np.array([self.user_index.get(uid, -1) for uid in user_ids],
+                        dtype=np.int64)
+
+    def item_columns(self, item_ids):
+        """Column positions of raw Movie IDs, with -1 for unknown movies."""
+        return np.array([self.item_index.get(iid, -1) for iid in item_ids],
+                        dtype=np.int64)
+
+    def ratings_of(self, user_ids):
+        """Ratings of the given users, one row each, unknown users skipped.
+
+        Parameters
+        ----------
+        user_ids : list (int)
+            Raw user IDs.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix (float32)
+            Ratings, shape (n_known_users, n_items).
+
+        """
+        rows = self.user_rows(user_ids)
+        return self.matrix[rows[rows >= 0]]
+
+
+@timed()
+def item_similarity(ratings, columns):
+    """Cosine similarity of some items to every item, over given users.
+
+    Parameters
+    ----------
+    ratings : scipy.sparse.csr_matrix
+        Ratings of a set of users, shape (n_users, n_items).
+    columns : np.ndarray (int)
+        Columns of the items to compare against.
+
+    Returns
+    -------
+    np.ndarray (float32)
+        Similarities, shape (n_items, len(columns)). Items without any
+        rating from these users have a similarity of 0.
+
+    """
+    ratings = ratings.tocsc()
+    norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0))).ravel()
+    dots = (ratings.T @ ratings[:, columns]).toarray()
+    denominators = np.outer(norms, norms[columns])
+    similarity = np.zeros(dots.shape, dtype=np.float32)
+    np.divide(dots, denominators, out=similarity, where=denominators > 0)
+    return similarity
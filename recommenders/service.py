@@ -0,0 +1,339 @@
+"""
+
+    Local recommendation service shared by every app session.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Running the recommenders inside the Streamlit script thread means a
+    slow request blocks its session, and every app replica holds its own
+    copy of the data and models. This service loads them once, then forks
+    a pool of worker processes that share those pages (the factor arrays
+    are memory-mapped, everything else is copy-on-write), and answers
+    batches of requests over HTTP on localhost:
+
+        POST /recommend  {"requests": [{"seeds": [...], "algorithm":
+                          "content", "top_n": 10}, ...]}
+        GET  /health
+
+    The number of batches in flight is bounded, so an overloaded service
+    answers 503 instead of queueing without limit, and each request has a
+    deadline after which it is reported as timed out. A pool with a timed
+    out request is replaced by a fresh one, and its workers are killed
+    once the other requests they hold are past their deadline, so stuck
+    requests do not pile up on the workers.
+
+    Changes to the data and models are picked up by the parent: it checks
+    the recommenders' watchers, reloads, and forks a new pool, so the
+    workers keep sharing one copy rather than each reloading its own.
+    Results are cached in the service, see `recommenders.cache`. Start
+    it with:
+
+        python -m recommenders.service --processes 4
+
+    and point the app at it with `RECOMMENDER_SERVICE_URL`, see
+    `recommenders.client`.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import importlib
+import json
+import multiprocessing
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from recommenders.cache import recommendation_cache
+from utils.lazy import warm_up
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Algorithm names accepted by the service, and the function serving each.
+ALGORITHMS = {'content': ('recommenders.content_based', 'content_model'),
+              'collab': ('recommenders.collaborative_based', 'collab_model'),
+              'hybrid': ('recommenders.hybrid', 'hybrid_model')}
+
+# Watchers of the files the recommenders load, see `utils.lazy`.
+WATCHERS = (('recommenders.content_based', 'catalogue_watcher'),
+            ('recommenders.collaborative_based', 'model_watcher'))
+
+
+class ServiceBusy(Exception):
+    """Raised when the service has too many batches in flight."""
+
+
+def _watchers():
+    return [getattr(importlib.import_module(module), name)
+            for module, name in WATCHERS]
+
+
+def _init_worker():
+    """Stop a pool worker from reloading by itself; the parent reloads
+    and replaces the pool instead."""
+    for watcher in _watchers():
+        watcher.interval = float('inf')
+
+
+def _recommend(algorithm, seeds, top_n):
+    """Run one recommender, inside a pool worker."""
+    module, name = ALGORITHMS[algorithm]
+    recommender = getattr(importlib.import_module(module), name)
+    return recommender(list(seeds), top_n)
+
+
+def _parse_request(request):
+    """Validate one request of a batch, returning (algorithm, seeds, top_n)."""
+    algorithm = request.get('algorithm')
+    if algorithm not in ALGORITHMS:
+        raise ValueError('unknown algorithm: {!r}'.format(algorithm))
+    seeds = request.get('seeds')
+    if not isinstance(seeds, list) or not all(isinstance(s, str) for s in seeds):
+        raise ValueError('seeds must be a list of titles')
+    top_n = request.get('top_n', 10)
+    if not isinstance(top_n, int) or top_n <= 0:
+        raise ValueError('top_n must be a positive integer')
+    return algorithm, seeds, top_n
+
+
+class RecommendationService:
+    """Process pool answering batches of recommendation requests.
+
+    Parameters
+    ----------
+    processes : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+    max_concurrent : int, optional
+        Maximum number of batches in flight, defaults to twice the
+        number of workers.
+    timeout : float
+        Seconds a request may take, including time spent waiting for a
+        free worker.
+    cache : RecommendationCache, optional
+        Cache of results, None to disable.
+
+    """
+
+    def __init__(self, processes=None, max_concurrent=None, timeout=10.0,
+                 cache=recommendation_cache):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_concurrent = max_concurrent or 2 * self.processes
+        self.timeout = timeout
+        self.cache = cache
+        self.pool = None
+        self.restarts = 0
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        # Held while reloading and forking, so no other thread of the
+        # service holds a lock the new workers need.
+        self._pool_lock = threading.Lock()
+        self._retired = set()
+        self._watchers = []
+
+    def _fork(self):
+        try:
+            # Forked workers share the parent's loaded pages.
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            context = multiprocessing.get_context()
+        return context.Pool(self.processes, initializer=_init_worker)
+
+    def start(self):
+        """Load the data and models, then fork the workers."""
+        warm_up(*(module for module, _ in ALGORITHMS.values()))
+        self._watchers = _watchers()
+        self.pool = self._fork()
+        return self
+
+    def close(self):
+        """Stop the workers."""
+        with self._pool_lock:
+            pools = list(self._retired) + [self.pool]
+            self._retired.clear()
+            self.pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def _current_pool(self):
+        """The pool to send requests to, replaced first if the data or
+        models changed since it was forked."""
+        with self._pool_lock:
+            # Every watcher is checked, so each resets what it watches.
+            if any([watcher.check() for watcher in self._watchers]):
+                warm_up()
+                self._replace(self.pool)
+            return self.pool
+
+    def _recycle(self, pool):
+        """Replace a pool holding timed out requests, unless that was
+        already done by another batch."""
+        with self._pool_lock:
+            if pool is self.pool:
+                self._replace(pool)
+
+    def _replace(self, pool):
+        # Called with the pool lock held. The old pool takes no new work,
+        # and its workers are killed once every request it holds is past
+        # its deadline.
+        self.pool = self._fork()
+        self.restarts += 1
+        pool.close()
+        self._retired.add(pool)
+        timer = threading.Timer(self.timeout, self._stop, (pool,))
+        timer.daemon = True
+        timer.start()
+
+    def _stop(self, pool):
+        with self._pool_lock:
+            if pool not in self._retired:
+                return
+            self._retired.discard(pool)
+        pool.terminate()
+        pool.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def recommend_batch(self, requests):
+        """Answer a batch of requests.
+
+        Parameters
+        ----------
+        requests : list (dict)
+            Requests with `seeds` (list of titles), `algorithm` and an
+            optional `top_n`.
+
+        Returns
+        -------
+        list (dict)
+            One result per request, in order: `{"recommendations": [...]}`
+            or `{"error": "..."}`.
+
+        Raises
+        ------
+        ServiceBusy
+            If no slot frees up within the timeout.
+
+        """
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise ServiceBusy('too many requests in flight')
+        try:
+            pool = self._current_pool()
+            results, pending, timed_out = [None] * len(requests), {}, False
+            for position, request in enumerate(requests):
+                try:
+                    algorithm, seeds, top_n = _parse_request(request)
+                except (AttributeError, ValueError) as e:
+                    results[position] = {'error': str(e)}
+                    continue
+                key = cached = None
+                if self.cache is not None:
+                    key = self.cache.make_key(algorithm, seeds, top_n)
+                    cached = self.cache.get(key)
+                if cached is not None:
+                    results[position] = {'recommendations': list(cached)}
+                    continue
+                pending[position] = (key, pool.apply_async(
+                    _recommend, (algorithm, seeds, top_n)))
+            for position, (key, task) in pending.items():
+                try:
+                    recommendations = task.get(max(deadline - time.monotonic(), 0))
+                except multiprocessing.TimeoutError:
+                    results[position] = {'error': 'timed out'}
+                    timed_out = True
+                    continue
+                except Exception as e:
+                    results[position] = {'error': '{}: {}'.format(type(e).__name__, e)}
+                    continue
+                if self.cache is not None:
+                    self.cache.put(key, recommendations)
+                results[position] = {'recommendations': list(recommendations)}
+            if timed_out:
+                self._recycle(pool)
+            return results
+        finally:
+            self._slots.release()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """JSON over HTTP front end of a `RecommendationService`."""
+
+    service = None
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._send(404, {'error': 'not found'})
+        body = {'status': 'ok', 'processes': self.service.processes,
+                'restarts': self.service.restarts}
+        if self.service.cache is not None:
+            body['cache'] = self.service.cache.stats()
+        self._send(200, body)
+
+    def do_POST(self):
+        if self.path != '/recommend':
+            return self._send(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            requests = json.loads(self.rfile.read(length))['requests']
+            if not isinstance(requests, list):
+                raise ValueError('requests must be a list')
+        except (KeyError, TypeError, ValueError) as e:
+            return self._send(400, {'error': 'bad request: {}'.format(e)})
+        try:
+            results = self.service.recommend_batch(requests)
+        except ServiceBusy as e:
+            return self._send(503, {'error': str(e)})
+        self._send(200, {'results': results})
+
+    def log_message(self, format, *args):
+        # Requests are frequent; only errors are worth logging.
+        pass
+
+
+def serve(service, host=HOST, port=PORT):
+    """Serve a started service over HTTP until interrupted."""
+    handler = type('Handler', (_Handler,), {'service': service})
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print('Serving recommendations on http://{}:{} with {} workers'.format(
+            host, port, service.processes))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve recommendations to the app over HTTP.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes.')
+    parser.add_argument('--max-concurrent', type=int, default=None,
+                        help='Maximum number of batches in flight.')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='Seconds allowed per request.')
+    args = parser.parse_args()
+
+    with RecommendationService(processes=args.processes,
+                               max_concurrent=args.max_concurrent,
+                               timeout=args.timeout) as recommendation_service:
+        serve(recommendation_service, args.host, args.port)
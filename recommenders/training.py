@@ -0,0 +1,484 @@
+"""
+
+    Out-of-core training of the collaborative SVD model.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    The full MovieLens ratings do not comfortably fit in a pandas frame
+    and a Surprise trainset at once. This module instead:
+
+    1. streams `ratings.csv` in chunks, mapping raw user and Movie IDs to
+       dense int32 indices and writing the ratings as float32, into
+       memory-mapped arrays on disk (`ingest_ratings`);
+    2. trains a biased matrix factorisation model, r_ui = mu + b_u + b_i +
+       q_i . p_u, either with vectorised mini-batch SGD over blocks of
+       those arrays (`train_sgd`, the same objective as Surprise's `SVD`),
+       or with alternating least squares whose row solves are spread
+       across a process pool (`train_als`);
+    3. publishes the factors as a snapshot (see `publish_snapshot`), a
+       directory of `.npy` arrays the online `collab_model` path
+       memory-maps directly.
+
+    Train from the command line with:
+
+        python -m recommenders.training --method als --processes 4
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from recommenders.factors import SVDFactors, publish_snapshot
+
+RATINGS_PATH = 'resources/data/ratings.csv'
+FACTORS_PATH = 'resources/models/svd_factors'
+
+# Number of ratings read, or trained on, at a time.
+CHUNK_SIZE = 1000000
+
+
+class RatingArrays:
+    """Ratings as dense-indexed, possibly memory-mapped, arrays.
+
+    Parameters
+    ----------
+    users : np.ndarray (int32)
+        Dense user index of each rating.
+    items : np.ndarray (int32)
+        Dense item index of each rating.
+    ratings : np.ndarray (float32)
+        Rating values.
+    user_ids : np.ndarray (int)
+        Raw user ID of each dense user index.
+    item_ids : np.ndarray (int)
+        Raw Movie ID of each dense item index.
+    global_mean : float
+        Mean of all ratings.
+
+    """
+
+    def __init__(self, users, items, ratings, user_ids, item_ids, global_mean):
+        self.users = users
+        self.items = items
+        self.ratings = ratings
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.global_mean = float(global_mean)
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    def __len__(self):
+        return len(self.ratings)
+
+
+class IdMap:
+    """Incremental map from raw IDs to dense indices, in order of arrival."""
+
+    def __init__(self):
+        self.index = {}
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def map(self, raw_ids):
+        """Dense indices of an array of raw IDs, assigning new ones as needed."""
+        uniques, inverse = np.unique(raw_ids, return_inverse=True)
+        dense = np.empty(len(uniques), dtype=np.int32)
+        for position, raw_id in enumerate(uniques.tolist()):
+            index = self.index.get(raw_id)
+            if index is None:
+                index = self.index[raw_id] = len(self.ids)
+                self.ids.append(raw_id)
+            dense[position] = index
+        return dense[inverse]
+
+
+def _count_lines(path):
+    """Upper bound on the number of records of a CSV file."""
+    with open(path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 24), b''))
+
+
+def ingest_ratings(path_to_ratings, workdir, chunk_size=CHUNK_SIZE):
+    """Stream ratings from CSV into memory-mapped arrays.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to ratings stored in .csv format.
+    workdir : str
+        Directory receiving the arrays.
+    chunk_size : int
+        Number of CSV rows parsed at a time.
+
+    Returns
+    -------
+    RatingArrays
+        Memory-mapped ratings with dense user and item indices.
+
+    """
+    capacity = _count_lines(path_to_ratings) + 1
+    open_memmap = np.lib.format.open_memmap
+    users = open_memmap(os.path.join(workdir, 'users.npy'), mode='w+',
+                        dtype=np.int32, shape=(capacity,))
+    items = open_memmap(os.path.join(workdir, 'items.npy'), mode='w+',
+                        dtype=np.int32, shape=(capacity,))
+    ratings = open_memmap(os.path.join(workdir, 'ratings.npy'), mode='w+',
+                          dtype=np.float32, shape=(capacity,))
+    user_map, item_map = IdMap(), IdMap()
+    n_ratings, total = 0, 0.0
+    chunks = pd.read_csv(path_to_ratings, usecols=['userId', 'movieId', 'rating'],
+                         dtype={'userId': np.int64, 'movieId': np.int64,
+                                'rating': np.float32},
+                         chunksize=chunk_size)
+    for chunk in chunks:
+        chunk = chunk.dropna()
+        stop = n_ratings + len(chunk)
+        users[n_ratings:stop] = user_map.map(chunk['userId'].to_numpy())
+        items[n_ratings:stop] = item_map.map(chunk['movieId'].to_numpy())
+        ratings[n_ratings:stop] = chunk['rating'].to_numpy()
+        total += float(chunk['rating'].to_numpy().sum(dtype=np.float64))
+        n_ratings = stop
+    for array in (users, items, ratings):
+        array.flush()
+    return RatingArrays(users[:n_ratings], items[:n_ratings], ratings[:n_ratings],
+                        np.array(user_map.ids), np.array(item_map.ids),
+                        total / max(n_ratings, 1))
+
+
+def _init_factors(data, n_factors, init_std, seed):
+    rng = np.random.default_rng(seed)
+    pu = rng.normal(0, init_std, (data.n_users, n_factors)).astype(np.float32)
+    qi = rng.normal(0, init_std, (data.n_items, n_factors)).astype(np.float32)
+    bu = np.zeros(data.n_users, dtype=np.float32)
+    bi = np.zeros(data.n_items, dtype=np.float32)
+    return pu, qi, bu, bi
+
+
+def rmse(data, pu, qi, bu, bi, chunk_size=CHUNK_SIZE):
+    """Root mean squared training error, computed in chunks."""
+    squared = 0.0
+    for start in range(0, len(data), chunk_size):
+        u = np.asarray(data.users[start:start + chunk_size])
+        i = np.asarray(data.items[start:start + chunk_size])
+        r = np.asarray(data.ratings[start:start + chunk_size])
+        err = r - (data.global_mean + bu[u] + bi[i]
+                   + np.einsum('ij,ij->i', pu[u], qi[i]))
+        squared += float(err @ err)
+    return np.sqrt(squared / max(len(data), 1))
+
+
+def sgd_step(pu, qi, bu, bi, global_mean, users, items, ratings, lr, reg):
+    """Apply one vectorised SGD update for a mini-batch of ratings, in place.
+
+    Gradients of ratings sharing a user or an item are summed.
+
+    """
+    pu_u, qi_i = pu[users], qi[items]
+    err = ratings - (global_mean + bu[users] + bi[items]
+                     + np.einsum('ij,ij->i', pu_u, qi_i))
+    np.add.at(bu, users, lr * (err - reg * bu[users]))
+    np.add.at(bi, items, lr * (err - reg * bi[items]))
+    np.add.at(pu, users, lr * (err[:, np.newaxis] * qi_i - reg * pu_u))
+    np.add.at(qi, items, lr * (err[:, np.newaxis] * pu_u - reg * qi_i))
+
+
+def solve_row(fixed, ratings, global_mean, reg):
+    """Regularised least-squares factors and bias of one user or item.
+
+    Solves for x = [factors, bias] in
+
+        (X^T X + reg * n * I) x = X^T (r - mu - b_other)
+
+    where X holds the other side's [factors, 1] for the n ratings r.
+
+    Parameters
+    ----------
+    fixed : np.ndarray
+        Rows [factors, 1, bias] of the rated items (or rating users).
+    ratings : np.ndarray
+        Ratings, aligned with `fixed`.
+    global_mean : float
+        Mean of all ratings.
+    reg : float
+        L2 regularisation, scaled by the number of ratings.
+
+    Returns
+    -------
+    np.ndarray (float64)
+        Factors followed by the bias.
+
+    """
+    fixed = np.asarray(fixed, dtype=np.float64)
+    features = fixed[:, :-1]
+    target = ratings - global_mean - fixed[:, -1]
+    return np.linalg.solve(
+        features.T @ features + reg * len(ratings) * np.eye(features.shape[1]),
+        features.T @ target)
+
+
+def train_sgd(data, n_factors=100, n_epochs=20, lr=0.005, reg=0.02,
+              init_std=0.1, batch_size=4096, block_size=CHUNK_SIZE, seed=0,
+              verbose=False):
+    """Fit a biased SVD model with vectorised mini-batch SGD.
+
+    Each epoch visits blocks of `block_size` ratings in random order, and
+    the ratings within a block in random order, so only one block needs
+    to be resident at a time. Each mini-batch is one `sgd_step`. Defaults
+    match Surprise's `SVD`.
+
+    Parameters
+    ----------
+    data : RatingArrays
+        Training ratings.
+    n_factors : int
+        Number of latent factors.
+    n_epochs : int
+        Number of passes over the ratings.
+    lr : float
+        Learning rate.
+    reg : float
+        L2 regularisation of factors and biases.
+    init_std : float
+        Standard deviation of the initial factors.
+    batch_size : int
+        Number of ratings per update.
+    block_size : int
+        Number of ratings loaded at a time.
+    seed : int
+        Seed of the initialisation and shuffling.
+    verbose : bool
+        Print the training error after each epoch.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+        pu, qi, bu and bi.
+
+    """
+    pu, qi, bu, bi = _init_factors(data, n_factors, init_std, seed)
+    rng = np.random.default_rng(seed + 1)
+    mu = data.global_mean
+    n_blocks = -(-len(data) // block_size)
+    for epoch in range(n_epochs):
+        start_time = time.time()
+        for block in rng.permutation(n_blocks):
+            start = block * block_size
+            block_users = np.asarray(data.users[start:start + block_size])
+            block_items = np.asarray(data.items[start:start + block_size])
+            block_ratings = np.asarray(data.ratings[start:start + block_size])
+            order = rng.permutation(len(block_ratings))
+            for batch_start in range(0, len(order), batch_size):
+                batch = order[batch_start:batch_start + batch_size]
+                sgd_step(pu, qi, bu, bi, mu, block_users[batch],
+                         block_items[batch], block_ratings[batch], lr, reg)
+        if verbose:
+            print('epoch {:>3}: rmse {:.4f} ({:.1f}s)'.format(
+                epoch + 1, rmse(data, pu, qi, bu, bi), time.time() - start_time))
+    return pu, qi, bu, bi
+
+
+def _save_csr(matrix, prefix):
+    for name in ('indptr', 'indices', 'data'):
+        np.save(prefix + '.' + name + '.npy', getattr(matrix, name))
+
+
+def _save_fixed(path, factors, biases):
+    """Save one side's factors as [factors, 1, bias] rows for the workers."""
+    fixed = np.empty((len(factors), factors.shape[1] + 2), dtype=np.float32)
+    fixed[:, :-2] = factors
+    fixed[:, -2] = 1
+    fixed[:, -1] = biases
+    np.save(path, fixed)
+
+
+def _solve_rows(task):
+    """`solve_row` over a block of rows, run inside a pool worker."""
+    prefix, fixed_path, start, stop, reg, mu = task
+    indptr = np.load(prefix + '.indptr.npy', mmap_mode='r')
+    indices = np.load(prefix + '.indices.npy', mmap_mode='r')
+    values = np.load(prefix + '.data.npy', mmap_mode='r')
+    fixed = np.load(fixed_path, mmap_mode='r')
+    solved = np.zeros((stop - start, fixed.shape[1] - 1), dtype=np.float32)
+    for row in range(start, stop):
+        lo, hi = indptr[row], indptr[row + 1]
+        if lo < hi:
+            solved[row - start] = solve_row(fixed[indices[lo:hi]],
+                                            values[lo:hi], mu, reg)
+    return start, solved
+
+
+def train_als(data, workdir, n_factors=100, n_epochs=10, reg=0.05,
+              init_std=0.1, processes=None, block_size=2048, seed=0,
+              verbose=False):
+    """Fit a biased SVD model with alternating least squares.
+
+    The ratings are grouped by user and by item once (CSR arrays written
+    to `workdir`), then each epoch solves every item given the users and
+    every user given the items. Rows are solved independently, in blocks
+    spread across a process pool; workers memory-map the rating arrays
+    and the fixed side's factors from `workdir`, so nothing large is
+    copied between processes.
+
+    Parameters
+    ----------
+    data : RatingArrays
+        Training ratings.
+    workdir : str
+        Directory holding the arrays shared with the workers.
+    n_factors : int
+        Number of latent factors.
+    n_epochs : int
+        Number of alternations.
+    reg : float
+        L2 regularisation, scaled by each row's number of ratings.
+    init_std : float
+        Standard deviation of the initial factors.
+    processes : int, optional
+        Number of worker processes, defaults to the number of CPUs. With
+        1, rows are solved in this process.
+    block_size : int
+        Number of rows per worker task.
+    seed : int
+        Seed of the initialisation.
+    verbose : bool
+        Print the training error after each epoch.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+        pu, qi, bu and bi.
+
+    """
+    pu, qi, bu, bi = _init_factors(data, n_factors, init_std, seed)
+    by_user = sp.csr_matrix(
+        (np.asarray(data.ratings), (np.asarray(data.users), np.asarray(data.items))),
+        shape=(data.n_users, data.n_items), dtype=np.float32)
+    user_prefix = os.path.join(workdir, 'by_user')
+    item_prefix = os.path.join(workdir, 'by_item')
+    _save_csr(by_user, user_prefix)
+    _save_csr(by_user.T.tocsr(), item_prefix)
+    del by_user
+
+    def solve(prefix, fixed_path, n_rows, pool):
+        tasks = [(prefix, fixed_path, start, min(start + block_size, n_rows),
+                  reg, data.global_mean)
+                 for start in range(0, n_rows, block_size)]
+        results = pool.imap_unordered(_solve_rows, tasks) if pool else map(_solve_rows, tasks)
+        solved = np.empty((n_rows, n_factors + 1), dtype=np.float32)
+        for start, block in results:
+            solved[start:start + len(block)] = block
+        return solved[:, :-1], solved[:, -1]
+
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    try:
+        for epoch in range(n_epochs):
+            start_time = time.time()
+            fixed_path = os.path.join(workdir, 'fixed.npy')
+            _save_fixed(fixed_path, pu, bu)
+            qi, bi = solve(item_prefix, fixed_path, data.n_items, pool)
+            _save_fixed(fixed_path, qi, bi)
+            pu, bu = solve(user_prefix, fixed_path, data.n_users, pool)
+            if verbose:
+                print('epoch {:>3}: rmse {:.4f} ({:.1f}s)'.format(
+                    epoch + 1, rmse(data, pu, qi, bu, bi), time.time() - start_time))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return pu, qi, bu, bi
+
+
+def train_factors(path_to_ratings=RATINGS_PATH, method='sgd', workdir=None,
+                  chunk_size=CHUNK_SIZE, **kwargs):
+    """Train a model from a ratings CSV without loading it into memory.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to ratings stored in .csv format.
+    method : str
+        'sgd' or 'als'.
+    workdir : str, optional
+        Directory for intermediate arrays, a temporary directory if None.
+    chunk_size : int
+        Number of CSV rows parsed at a time.
+    **kwargs
+        Passed on to `train_sgd` or `train_als`.
+
+    Returns
+    -------
+    SVDFactors
+        The trained model.
+
+    """
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        data = ingest_ratings(path_to_ratings, tmpdir, chunk_size=chunk_size)
+        if method == 'als':
+            pu, qi, bu, bi = train_als(data, tmpdir, **kwargs)
+        else:
+            pu, qi, bu, bi = train_sgd(data, **kwargs)
+        rating_scale = (float(np.min(data.ratings)), float(np.max(data.ratings)))
+        return SVDFactors(pu=pu, qi=qi, bu=bu, bi=bi,
+                          global_mean=data.global_mean,
+                          user_ids=data.user_ids, item_ids=data.item_ids,
+                          rating_scale=rating_scale)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Train the collaborative SVD model out of core.')
+    parser.add_argument('--ratings', default=RATINGS_PATH,
+                        help='Ratings to train on (.csv).')
+    parser.add_argument('--output', default=FACTORS_PATH,
+                        help='Directory receiving the factor snapshots.')
+    parser.add_argument('--method', choices=('sgd', 'als'), default='sgd')
+    parser.add_argument('--factors', type=int, default=100,
+                        help='Number of latent factors.')
+    parser.add_argument('--epochs', type=int, default=None,
+                        help='Number of epochs (default: 20 for SGD, '
+                             '10 for ALS).')
+    parser.add_argument('--reg', type=float, default=None,
+                        help='Regularisation strength.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Worker processes for ALS.')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='CSV rows parsed at a time.')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for intermediate arrays.')
+    args = parser.parse_args()
+
+    options = {'n_factors': args.factors, 'verbose': True}
+    if args.epochs is not None:
+        options['n_epochs'] = args.epochs
+    if args.reg is not None:
+        options['reg'] = args.reg
+    if args.method == 'als':
+        options['processes'] = args.processes
+
+    start = time.time()
+    svd_factors = train_factors(args.ratings, method=args.method,
+                                workdir=args.workdir,
+                                chunk_size=args.chunk_size, **options)
+    snapshot = publish_snapshot(svd_factors, args.output)
+    print('Trained {} users x {} items x {} factors in {:.1f}s -> {}'.format(
+        len(svd_factors.user_ids), len(svd_factors.item_ids),
+        svd_factors.n_factors, time.time() - start, snapshot))
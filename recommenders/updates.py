@@ -0,0 +1,167 @@
+"""
+
+    Incremental updates of the models as new ratings and movies arrive.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Retraining the SVD model and refitting the content features from scratch
+    every day is slow. Instead, `update_factors` folds a batch of new
+    ratings into the existing factors:
+
+    - movies without factors are solved by regularised least squares
+      against the factors of the known users that rated them, then new
+      users against the factors of the movies they rated (fold-in);
+    - a few vectorised SGD epochs over the new ratings then adjust every
+      user and movie they touch.
+
+    The global mean is left as trained. The updated factors are published
+    as a new snapshot, which serving processes pick up atomically (see
+    `publish_snapshot`). Movies appended to `movies.csv` are added to the
+    content features by `content_features.load_or_build_features` without
+    refitting them. Apply a day's updates with:
+
+        python -m recommenders.updates --ratings new_ratings.csv
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import numpy as np
+from recommenders.factors import SVDFactors
+from recommenders.training import sgd_step, solve_row
+
+
+def _extend(array, n_rows):
+    """Copy of an array with `n_rows` rows of zeros appended."""
+    extra = np.zeros((n_rows,) + array.shape[1:], dtype=array.dtype)
+    return np.concatenate([array, extra])
+
+
+def _fold_in(rows, other_rows, ratings, fixed, known, global_mean, reg):
+    """Least-squares solutions for each distinct row, over its known partners."""
+    rows, other_rows, ratings = rows[known], other_rows[known], ratings[known]
+    order = np.argsort(rows, kind='stable')
+    distinct, starts = np.unique(rows[order], return_index=True)
+    solved = {}
+    for row, group in zip(distinct.tolist(), np.split(order, starts[1:])):
+        solved[row] = solve_row(fixed[other_rows[group]], ratings[group],
+                                global_mean, reg)
+    return solved
+
+
+def update_factors(factors, ratings, n_epochs=5, lr=0.005, reg=0.02,
+                   fold_in_reg=0.05, batch_size=4096, seed=0):
+    """Fold a batch of new ratings into a model.
+
+    Parameters
+    ----------
+    factors : SVDFactors
+        Current model, left unchanged.
+    ratings : Pandas Dataframe
+        New ratings, with `userId`, `movieId` and `rating` columns.
+    n_epochs : int
+        SGD epochs over the new ratings after the fold-in.
+    lr : float
+        SGD learning rate.
+    reg : float
+        SGD regularisation.
+    fold_in_reg : float
+        Fold-in regularisation, scaled by the number of ratings.
+    batch_size : int
+        Number of ratings per SGD update.
+    seed : int
+        Seed of the shuffling.
+
+    Returns
+    -------
+    SVDFactors
+        The updated model, including any new users and movies.
+
+    """
+    raw_users = ratings['userId'].to_numpy()
+    raw_items = ratings['movieId'].to_numpy()
+    values = ratings['rating'].to_numpy(dtype=np.float32)
+    new_user_ids = np.setdiff1d(raw_users, factors.user_ids)
+    new_item_ids = np.setdiff1d(raw_items, factors.item_ids)
+    n_users, n_items = len(factors.user_ids), len(factors.item_ids)
+
+    # Writable copies, grown with zero rows for the new users and movies.
+    pu = _extend(np.asarray(factors.pu), len(new_user_ids))
+    bu = _extend(np.asarray(factors.bu), len(new_user_ids))
+    qi = _extend(np.asarray(factors.qi), len(new_item_ids))
+    bi = _extend(np.asarray(factors.bi), len(new_item_ids))
+    user_ids = np.concatenate([factors.user_ids, new_user_ids])
+    item_ids = np.concatenate([factors.item_ids, new_item_ids])
+    user_rows = dict(factors.user_rows)
+    user_rows.update((uid, n_users + i) for i, uid in enumerate(new_user_ids.tolist()))
+    item_rows = dict(factors.item_rows)
+    item_rows.update((iid, n_items + i) for i, iid in enumerate(new_item_ids.tolist()))
+    users = np.array([user_rows[uid] for uid in raw_users.tolist()], dtype=np.int64)
+    items = np.array([item_rows[iid] for iid in raw_items.tolist()], dtype=np.int64)
+    mu = factors.global_mean
+
+    # New movies, against the users the model already knows.
+    new_items = items >= n_items
+    fixed = np.column_stack([pu, np.ones(len(pu)), bu])
+    solved = _fold_in(items[new_items], users[new_items], values[new_items],
+                      fixed, users[new_items] < n_users, mu, fold_in_reg)
+    for row, solution in solved.items():
+        qi[row], bi[row] = solution[:-1], solution[-1]
+
+    # New users, against every movie they rated.
+    new_users = users >= n_users
+    fixed = np.column_stack([qi, np.ones(len(qi)), bi])
+    solved = _fold_in(users[new_users], items[new_users], values[new_users],
+                      fixed, np.ones(new_users.sum(), dtype=bool), mu, fold_in_reg)
+    for row, solution in solved.items():
+        pu[row], bu[row] = solution[:-1], solution[-1]
+
+    rng = np.random.default_rng(seed)
+    for _ in range(n_epochs):
+        order = rng.permutation(len(values))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            sgd_step(pu, qi, bu, bi, mu, users[batch], items[batch],
+                     values[batch], lr, reg)
+
+    return SVDFactors(pu=pu, qi=qi, bu=bu, bi=bi, global_mean=mu,
+                      user_ids=user_ids, item_ids=item_ids,
+                      rating_scale=factors.rating_scale)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    import pandas as pd
+    from recommenders import collaborative_based
+    from recommenders.content_features import load_or_build_features
+    from recommenders.factors import publish_snapshot
+    from utils.data_loader import load_movies
+
+    parser = argparse.ArgumentParser(
+        description='Fold new ratings and movies into the models.')
+    parser.add_argument('--ratings', help='New ratings to fold in (.csv).')
+    parser.add_argument('--epochs', type=int, default=5,
+                        help='SGD epochs over the new ratings.')
+    parser.add_argument('--output', default=collaborative_based.FACTORS_PATH,
+                        help='Directory holding the factor snapshots.')
+    args = parser.parse_args()
+
+    start = time.time()
+    # Extends the content features with movies appended to the catalogue.
+    content_features = load_or_build_features(load_movies('resources/data/movies.csv'))
+    print('Content features cover {} movies ({:.1f}s)'.format(
+        len(content_features), time.time() - start))
+    if args.ratings:
+        start = time.time()
+        new_ratings = pd.read_csv(args.ratings,
+                                  usecols=['userId', 'movieId', 'rating'])
+        updated = update_factors(collaborative_based.get_factors(), new_ratings,
+                                 n_epochs=args.epochs)
+        snapshot = publish_snapshot(updated, args.output)
+        print('Folded {} ratings into {} users x {} items in {:.1f}s -> {}'.format(
+            len(new_ratings), len(updated.user_ids), len(updated.item_ids),
+            time.time() - start, snapshot))
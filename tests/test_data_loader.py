@@ -0,0 +1,80 @@
+"""Tests of the CSV cache of `utils.data_loader`."""
+
+import os
+import numpy as np
+import pytest
+from utils.data_loader import _cache_path, file_signature, load_columns
+from utils.instrumentation import metrics
+
+DTYPES = {'movieId': np.int32}
+
+
+def write_csv(path, rows, mtime_ns=None):
+    with open(path, 'w') as f:
+        f.write('movieId,title\n')
+        f.writelines('{},{}\n'.format(*row) for row in rows)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def misses():
+    return metrics.snapshot()['counters'].get('csv_cache_misses', 0)
+
+
+@pytest.fixture
+def csv(tmp_path):
+    path = str(tmp_path / 'movies.csv')
+    write_csv(path, [(1, 'Heat'), (2, 'Jumanji')], mtime_ns=10 ** 18)
+    return path
+
+
+def load(path, tmp_path):
+    return load_columns(path, DTYPES, cache_dir=str(tmp_path / 'cache'))
+
+
+def test_second_load_hits_the_cache(csv, tmp_path):
+    first = load(csv, tmp_path)
+    before = misses()
+    second = load(csv, tmp_path)
+    assert misses() == before
+    assert second['movieId'].tolist() == first['movieId'].tolist() == [1, 2]
+    assert second['title'].tolist() == ['Heat', 'Jumanji']
+
+
+def test_touched_file_keeps_its_entry(csv, tmp_path):
+    load(csv, tmp_path)
+    os.utime(csv, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    before = misses()
+    assert load(csv, tmp_path)['title'].tolist() == ['Heat', 'Jumanji']
+    assert misses() == before
+
+
+def test_changed_contents_of_the_same_size_rebuild(csv, tmp_path):
+    load(csv, tmp_path)
+    write_csv(csv, [(1, 'Heat'), (2, 'Jumanjo')], mtime_ns=2 * 10 ** 18)
+    before = misses()
+    assert load(csv, tmp_path)['title'].tolist() == ['Heat', 'Jumanjo']
+    assert misses() == before + 1
+
+
+def test_changed_size_rebuilds(csv, tmp_path):
+    load(csv, tmp_path)
+    # Same modification time, so only the size tells the files apart.
+    write_csv(csv, [(1, 'Heat'), (2, 'Jumanji'), (3, 'Casino')],
+              mtime_ns=10 ** 18)
+    before = misses()
+    assert load(csv, tmp_path)['movieId'].tolist() == [1, 2, 3]
+    assert misses() == before + 1
+
+
+def test_file_signature_follows_contents(csv):
+    signature = file_signature(csv)
+    os.utime(csv, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    assert file_signature(csv) == signature
+    write_csv(csv, [(1, 'Heat'), (2, 'Jumanjo')])
+    assert file_signature(csv) != signature
+
+
+def test_files_of_the_same_name_get_their_own_entries(tmp_path):
+    first, second = tmp_path / 'a' / 'movies.csv', tmp_path / 'b' / 'movies.csv'
+    assert _cache_path(str(first), 'cache') != _cache_path(str(second), 'cache')
@@ -0,0 +1,26 @@
+"""Tests of `recommenders.factors`."""
+
+import numpy as np
+from recommenders.factors import top_k
+
+
+def test_top_k_orders_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_k(scores, 3).tolist() == [1, 3, 2]
+
+
+def test_top_k_breaks_ties_on_position():
+    scores = np.array([0.5, 1.0, 0.5, 0.5, 1.0, 0.2])
+    assert top_k(scores, 4).tolist() == [1, 4, 0, 2]
+
+
+def test_top_k_keeps_the_first_positions_tied_at_the_cut():
+    scores = np.array([0.3, 0.3, 0.9, 0.3, 0.3])
+    assert top_k(scores, 2).tolist() == [2, 0]
+
+
+def test_top_k_clips_k():
+    scores = np.array([0.2, 0.4])
+    assert top_k(scores, 5).tolist() == [1, 0]
+    assert top_k(scores, 0).tolist() == []
+    assert top_k(np.empty(0), 3).tolist() == []
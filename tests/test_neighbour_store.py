@@ -0,0 +1,31 @@
+"""Tests of `recommenders.neighbour_store`."""
+
+import numpy as np
+from recommenders.neighbour_store import merge_neighbours
+
+
+def test_merge_neighbours_sums_scores_across_lists():
+    neighbours = np.array([[10, 20, 30],
+                           [20, 40, -1]])
+    scores = np.array([[0.9, 0.5, 0.1],
+                       [0.6, 0.3, 0.0]])
+    ids, totals = merge_neighbours(neighbours, scores)
+    assert ids.tolist() == [20, 10, 40, 30]
+    np.testing.assert_allclose(totals, [1.1, 0.9, 0.3, 0.1])
+
+
+def test_merge_neighbours_skips_padding_and_excluded_ids():
+    neighbours = np.array([[10, 20, -1],
+                           [10, 30, -1]])
+    scores = np.array([[0.5, 0.4, 9.0],
+                       [0.5, 0.2, 9.0]])
+    ids, totals = merge_neighbours(neighbours, scores, exclude=[10])
+    assert ids.tolist() == [20, 30]
+    np.testing.assert_allclose(totals, [0.4, 0.2])
+
+
+def test_merge_neighbours_breaks_ties_on_id():
+    neighbours = np.array([[30, 10, 20]])
+    scores = np.array([[0.5, 0.5, 0.5]])
+    ids, _ = merge_neighbours(neighbours, scores)
+    assert ids.tolist() == [10, 20, 30]
@@ -0,0 +1,71 @@
+"""Tests of `recommenders.popularity`."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from recommenders import popularity
+from recommenders.popularity import PopularityTable
+from utils.catalogue import Catalogue
+
+MOVIES = pd.DataFrame({'movieId': [1, 2, 3, 4],
+                       'title': ['A (2000)', 'B (2001)', 'C (2002)', 'D (2003)'],
+                       'genres': ['Drama'] * 4})
+
+
+@pytest.fixture
+def table():
+    # Movie 4 is never rated; movie 3 has one perfect rating.
+    ratings = {'movieId': np.array([1, 1, 1, 2, 2, 3, 99]),
+               'rating': np.array([4.0, 5.0, 4.5, 2.0, 3.0, 5.0, 1.0])}
+    return PopularityTable.from_ratings(ratings, MOVIES['movieId'].to_numpy(),
+                                        prior_count=1)
+
+
+def test_from_ratings_counts_known_movies_only(table):
+    assert table.counts.tolist() == [3, 2, 1, 0]
+
+
+def test_from_ratings_shrinks_scores_to_the_mean(table):
+    mean = np.mean([4.0, 5.0, 4.5, 2.0, 3.0, 5.0])
+    np.testing.assert_allclose(table.scores,
+                               [(mean + 13.5) / 4, (mean + 5.0) / 3,
+                                (mean + 5.0) / 2, mean], rtol=1e-6)
+
+
+def test_top_applies_min_ratings_and_exclude(table):
+    assert table.top(3, min_ratings=0).tolist() == [3, 1, 4]
+    assert table.top(3, min_ratings=2).tolist() == [1, 2]
+    assert table.top(3, exclude=[1], min_ratings=2).tolist() == [2]
+
+
+def test_save_and_load_round_trip(table, tmp_path):
+    path = str(tmp_path / 'popularity.npz')
+    table.signature = 'sig'
+    table.save(path)
+    loaded = PopularityTable.load(path)
+    assert loaded.signature == 'sig'
+    np.testing.assert_array_equal(loaded.scores, table.scores)
+
+
+@pytest.fixture
+def popular(monkeypatch):
+    # Movie 4 has too few ratings to be recommended.
+    table = PopularityTable(MOVIES['movieId'].to_numpy(dtype=np.int32),
+                            np.array([30, 25, 40, 1], dtype=np.int32),
+                            np.array([3.5, 4.0, 4.5, 5.0], dtype=np.float32))
+    monkeypatch.setattr(popularity, 'get_popularity', lambda: table)
+    return table
+
+
+def test_with_fallback_tops_up_with_popular_movies(popular):
+    catalogue = Catalogue(MOVIES)
+    titles = popularity.with_fallback(['A (2000)'], catalogue, [3], top_n=3)
+    assert titles == ['A (2000)', 'B (2001)']
+
+
+def test_with_fallback_keeps_full_lists(popular):
+    catalogue = Catalogue(MOVIES)
+    assert popularity.with_fallback(['D (2003)', 'C (2002)'], catalogue,
+                                    [], top_n=1) == ['D (2003)']
+    assert popularity.with_fallback([], catalogue, [], top_n=2) == [
+        'C (2002)', 'B (2001)']
@@ -0,0 +1,57 @@
+"""Tests of `utils.title_search`."""
+
+import pytest
+from utils.title_search import TitleIndex, normalise_title
+
+TITLES = ['Matrix, The (1999)', 'Up! (1976)', 'Up (2009)',
+          'A.I. Artificial Intelligence (2001)', 'I (2015)',
+          'Samouraï, Le (Godson, The) (1967)', 'Samurai (Samourais) (2002)',
+          'Misérables, Les (1995)', 'Heat (1995)', 'Heat (1972)',
+          'Star Wars: Episode IV - A New Hope (1977)']
+
+
+@pytest.fixture(scope='module')
+def index():
+    return TitleIndex(TITLES)
+
+
+@pytest.mark.parametrize('title, key, full_key', [
+    ('Matrix, The (1999)', 'matrix', 'the matrix'),
+    ('The Matrix', 'matrix', 'the matrix'),
+    ('Misérables, Les (1995)', 'miserables', 'les miserables'),
+    ('A.I. Artificial Intelligence (2001)', 'a i artificial intelligence',
+     'a i artificial intelligence'),
+    ('Star Wars: Episode IV - A New Hope (1977)',
+     'star wars episode iv a new hope', 'star wars episode iv a new hope'),
+])
+def test_normalise_title(title, key, full_key):
+    assert normalise_title(title) == key
+    assert normalise_title(title, leading_article=True) == full_key
+
+
+@pytest.mark.parametrize('query, title', [
+    ('Matrix, The (1999)', 'Matrix, The (1999)'),
+    ('the matrix', 'Matrix, The (1999)'),
+    ('MATRIX', 'Matrix, The (1999)'),
+    ('les miserables', 'Misérables, Les (1995)'),
+    ('Up', 'Up (2009)'),
+    ('up!', 'Up! (1976)'),
+    ('Heat', 'Heat (1995)'),
+    ('Heat (1972)', 'Heat (1972)'),
+])
+def test_resolve_normalised_exact_matches(index, query, title):
+    assert index.resolve(query) == title
+
+
+@pytest.mark.parametrize('query', ['star wars', 'a.i.', 'Le Samourai',
+                                   'matrx', 'the', ''])
+def test_resolve_rejects_other_titles(index, query):
+    with pytest.raises(KeyError):
+        index.resolve(query)
+
+
+def test_search_matches_prefixes_and_typos(index):
+    assert index.search('star w', limit=1) == [
+        'Star Wars: Episode IV - A New Hope (1977)']
+    assert index.search('matrx', limit=1) == ['Matrix, The (1999)']
+    assert index.search('up', limit=2) == ['Up (2009)', 'Up! (1976)']
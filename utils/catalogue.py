@@ -0,0 +1,159 @@
+"""
+
+    Shared movie catalogue with constant-time title and ID lookups.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Every recommender resolves the app user's chosen titles to rows of
+    `movies.csv`, and turns result rows back into titles. The catalogue is
+    loaded once per process by `load_catalogue` and exposes hashed
+    title -> movieId -> row mappings, plus row-aligned arrays, so neither
+    direction requires a scan or a copy of the title column.
+
+    Row positions match `load_movie_titles`, i.e. the catalogue with
+    incomplete records dropped.
+
+    Title lookups tolerate differences in case, accents, punctuation,
+    articles and the year: a title missing from the catalogue resolves to
+    the title equal to it once normalised (see `utils.title_search`), and
+    raises `KeyError` when there is none. Misspelt titles are not
+    guessed at.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import functools
+import numpy as np
+from utils.data_loader import load_movies
+from utils.lazy import memoize
+
+MOVIES_PATH = 'resources/data/movies.csv'
+
+
+class Catalogue:
+    """Row-aligned movie records with hashed lookups.
+
+    Parameters
+    ----------
+    movies : Pandas Dataframe
+        Movie records with `movieId`, `title` and `genres` columns,
+        indexed by row position.
+
+    """
+
+    def __init__(self, movies):
+        self.movies = movies
+        self.movie_ids = movies['movieId'].to_numpy(dtype=np.int32)
+        self.titles = movies['title'].to_numpy(dtype=object)
+        self.genres = movies['genres'].to_numpy(dtype=object)
+        self.movie_id_to_row = {
+            movie_id: row for row, movie_id in enumerate(self.movie_ids.tolist())}
+        # Titles are not unique; the first row holding a title wins.
+        self.title_to_row = {}
+        for row, title in enumerate(self.titles):
+            self.title_to_row.setdefault(title, row)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def __contains__(self, title):
+        return title in self.title_to_row
+
+    @functools.cached_property
+    def title_index(self):
+        """Search index over the distinct titles."""
+        from utils.title_search import TitleIndex
+        return TitleIndex(list(self.title_to_row))
+
+    def row_for_title(self, title):
+        """Row position of a movie title, or of the title equal to it once
+        normalised, raising `KeyError` if there is none."""
+        row = self.title_to_row.get(title)
+        if row is None:
+            row = self.title_to_row[self.title_index.resolve(title)]
+        return row
+
+    def known_titles(self, titles):
+        """Catalogue titles of several titles, skipping titles that
+        match none."""
+        known = []
+        for title in titles:
+            try:
+                known.append(self.titles[self.row_for_title(title)])
+            except KeyError:
+                continue
+        return known
+
+    def rows_for_titles(self, titles):
+        """Row positions of several movie titles.
+
+        Parameters
+        ----------
+        titles : list (str)
+            Movie titles.
+
+        Returns
+        -------
+        np.ndarray (int)
+            Row position of each title.
+
+        """
+        return np.array([self.row_for_title(title) for title in titles],
+                        dtype=np.int64)
+
+    def movie_id_for_title(self, title):
+        """MovieLens Movie ID of a movie title."""
+        return int(self.movie_ids[self.row_for_title(title)])
+
+    def movie_ids_for_titles(self, titles):
+        """MovieLens Movie IDs of several movie titles."""
+        return self.movie_ids[self.rows_for_titles(titles)]
+
+    def rows_for_movie_ids(self, movie_ids):
+        """Row positions of several Movie IDs, with -1 for unknown IDs."""
+        return np.array([self.movie_id_to_row.get(movie_id, -1)
+                         for movie_id in movie_ids], dtype=np.int64)
+
+    def titles_for_rows(self, rows):
+        """Movie titles of several row positions.
+
+        Parameters
+        ----------
+        rows : array-like (int)
+            Row positions.
+
+        Returns
+        -------
+        list (str)
+            Movie titles, in the order of `rows`.
+
+        """
+        return self.titles[np.asarray(rows, dtype=np.int64)].tolist()
+
+    def titles_for_movie_ids(self, movie_ids):
+        """Movie titles of several Movie IDs, skipping unknown IDs."""
+        rows = self.rows_for_movie_ids(movie_ids)
+        return self.titles_for_rows(rows[rows >= 0])
+
+
+@memoize
+def load_catalogue(path_to_movies=MOVIES_PATH):
+    """Load the movie catalogue, once per process and path.
+
+    Parameters
+    ----------
+    path_to_movies : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+
+    Returns
+    -------
+    Catalogue
+        The shared catalogue.
+
+    """
+    return Catalogue(load_movies(path_to_movies))
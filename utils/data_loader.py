@@ -4,10 +4,264 @@
 
     Author: Explore Data Science Academy.
 
+    Note:
+    ---------------------------------------------------------------------
+    Parsing the MovieLens CSVs is slow, so the first load of each file
+    converts it into a columnar binary cache under `resources/cache`: one
+    `.npy` file per column (int32 ids, float32 ratings), and text columns
+    as a UTF-8 byte buffer plus offsets. Later loads memory-map the
+    columns instead of parsing. `load_rating_columns` returns those
+    memory maps as they are, so every process reading the ratings shares
+    the same pages; the data frames returned by `load_movies` and
+    `load_ratings` are private copies.
+
+    A cache entry records the size, modification time and SHA-1 of its
+    source file, and is rebuilt whenever the source changes. Models and
+    indexes built elsewhere from these files are likewise validated
+    against `file_signature`, a hash of the contents.
+    ---------------------------------------------------------------------
+
 """
 # Data handling dependencies
+import hashlib
+import json
+import os
+import shutil
 import pandas as pd
 import numpy as np
+from utils.instrumentation import increment, timed
+from utils.lazy import memoize
+
+CACHE_DIR = 'resources/cache'
+
+# Compact dtypes used for the cached numeric columns.
+MOVIE_DTYPES = {'movieId': np.int32}
+RATING_DTYPES = {'userId': np.int32, 'movieId': np.int32,
+                 'rating': np.float32, 'timestamp': np.int64}
+RATING_COLUMNS = ('userId', 'movieId', 'rating', 'timestamp')
+
+# Signature of each file hashed so far, with the size and modification
+# time it was hashed at.
+_signatures = {}
+
+def file_signature(path):
+    """Signature of a file's contents, used to detect changes.
+
+    Like cache entries, artefacts built from a file are validated against
+    its contents, so a fresh checkout or a copy of unchanged files does
+    not make them stale. The file is only hashed again once its size or
+    modification time changes, so repeated checks cost one `stat`.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        The file size and SHA-1 of its contents.
+
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    known = _signatures.get(key)
+    if known is None or known[0] != stamp:
+        known = _signatures[key] = (stamp, '{}:{}'.format(stat.st_size,
+                                                          _file_hash(path)))
+    return known[1]
+
+def _file_hash(path):
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_path(path_to_csv, cache_dir):
+    """Cache entry of a CSV, e.g. `resources/cache/movies-<hash>`.
+
+    The entry is named after the file and a hash of its absolute path, so
+    files of the same name in different directories (test fixtures and
+    the real data, say) get entries of their own.
+
+    """
+    name = os.path.splitext(os.path.basename(path_to_csv))[0]
+    location = hashlib.sha1(os.path.abspath(path_to_csv).encode('utf-8'))
+    return os.path.join(cache_dir, '{}-{}'.format(name, location.hexdigest()[:12]))
+
+def drop_cache(path_to_csv, cache_dir=CACHE_DIR):
+    """Delete the cache entry of a CSV, e.g. of a temporary file."""
+    shutil.rmtree(_cache_path(path_to_csv, cache_dir), ignore_errors=True)
+
+def _cache_is_valid(path_to_csv, entry):
+    """Check a cache entry against its source file.
+
+    The size and modification time are compared first; if only the
+    modification time differs the contents are hashed, so touching or
+    copying the source does not force a rebuild.
+
+    """
+    meta_path = os.path.join(entry, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(path_to_csv)
+    if meta['size'] != stat.st_size:
+        return False
+    if meta['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if meta['sha1'] != _file_hash(path_to_csv):
+        return False
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _write_json(meta_path, meta)
+    return True
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _save_array(path, array):
+    # Write beside the target and rename, so readers never map a partial file.
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def _write_cache(path_to_csv, entry, df, dtypes):
+    """Convert a parsed CSV into a cache entry."""
+    os.makedirs(entry, exist_ok=True)
+    columns = {}
+    for column in df.columns:
+        if column in dtypes:
+            _save_array(os.path.join(entry, column + '.npy'),
+                        df[column].to_numpy(dtype=dtypes[column]))
+            columns[column] = 'numeric'
+        else:
+            encoded = [value.encode('utf-8') for value in df[column].astype(str)]
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64,
+                                  count=len(encoded))
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            _save_array(os.path.join(entry, column + '.bytes.npy'), buffer)
+            _save_array(os.path.join(entry, column + '.offsets.npy'), offsets)
+            columns[column] = 'text'
+    stat = os.stat(path_to_csv)
+    # The metadata is written last, marking the entry as complete.
+    _write_json(os.path.join(entry, 'meta.json'),
+                {'columns': columns, 'rows': len(df), 'size': stat.st_size,
+                 'mtime_ns': stat.st_mtime_ns, 'sha1': _file_hash(path_to_csv)})
+
+def _read_text_column(entry, column):
+    buffer = np.load(os.path.join(entry, column + '.bytes.npy')).tobytes()
+    offsets = np.load(os.path.join(entry, column + '.offsets.npy')).tolist()
+    return np.array([buffer[start:stop].decode('utf-8')
+                     for start, stop in zip(offsets[:-1], offsets[1:])],
+                    dtype=object)
+
+@timed('load_columns')
+def load_columns(path_to_csv, dtypes, columns=None, cache_dir=CACHE_DIR):
+    """Load columns of a CSV through the binary cache.
+
+    Parameters
+    ----------
+    path_to_csv : str
+        Relative or absolute path to the source .csv file.
+    dtypes : dict
+        Storage dtype of each numeric column; all other columns are
+        treated as text.
+    columns : list (str), optional
+        Columns to load. Defaults to every column of the file.
+    cache_dir : str
+        Directory holding the cache entries.
+
+    Returns
+    -------
+    dict
+        Column name to array. Numeric columns are read-only memory maps.
+
+    """
+    entry = _cache_path(path_to_csv, cache_dir)
+    if _cache_is_valid(path_to_csv, entry):
+        increment('csv_cache_hits')
+    else:
+        increment('csv_cache_misses')
+        df = pd.read_csv(path_to_csv).dropna()
+        _write_cache(path_to_csv, entry, df, dtypes)
+    with open(os.path.join(entry, 'meta.json')) as f:
+        stored = json.load(f)['columns']
+    arrays = {}
+    for column in (columns or list(stored)):
+        if stored[column] == 'numeric':
+            arrays[column] = np.load(os.path.join(entry, column + '.npy'),
+                                     mmap_mode='r')
+        else:
+            arrays[column] = _read_text_column(entry, column)
+    return arrays
+
+def load_movies(path_to_movies):
+    """Load movie records from database records.
+
+    Parameters
+    ----------
+    path_to_movies : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+
+    Returns
+    -------
+    Pandas Dataframe
+        Complete movie records, indexed by row position.
+
+    """
+    return pd.DataFrame(load_columns(path_to_movies, MOVIE_DTYPES))
+
+@memoize
+def load_rating_columns(path_to_ratings, columns=RATING_COLUMNS):
+    """Load user ratings as memory-mapped columns, once per process.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to ratings stored in .csv format.
+    columns : tuple (str)
+        Columns to load.
+
+    Returns
+    -------
+    dict
+        Column name to a read-only memory map of the cached column, whose
+        pages are shared by every process.
+
+    """
+    return load_columns(path_to_ratings, RATING_DTYPES, columns=list(columns))
+
+@memoize
+def load_ratings(path_to_ratings, columns=RATING_COLUMNS):
+    """Load user ratings, once per process.
+
+    The returned frame is shared between callers and must not be
+    modified in place. Pandas copies the columns into the frame, so
+    prefer `load_rating_columns` where arrays are enough.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to ratings stored in .csv format.
+    columns : tuple (str)
+        Columns to load.
+
+    Returns
+    -------
+    Pandas Dataframe
+        Ratings with int32 ids and float32 ratings.
+
+    """
+    return pd.DataFrame(load_rating_columns(path_to_ratings, columns))
 
 def load_movie_titles(path_to_movies):
     """Load movie titles from database records.
@@ -24,7 +278,6 @@ def load_movie_titles(path_to_movies):
         Movie titles.
 
     """
-    df = pd.read_csv(path_to_movies)
-    df = df.dropna()
+    df = load_movies(path_to_movies)
     movie_list = df['title'].to_list()
     return movie_list
@@ -0,0 +1,220 @@
+"""
+
+    Lightweight timing spans, counters and profiling hooks.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Hot paths are wrapped in named spans, with the `timed` decorator or
+    the `span` context manager. Each span records its number of calls and
+    errors, and its total and maximum duration; `increment` adds to plain
+    counters and `register_gauge` exposes values computed at export time.
+    Recording a span costs two clock reads and a lock.
+
+    Metrics are exported as Prometheus text (`to_prometheus`) or JSON
+    (`to_json`), and written with `write_metrics`. Setting the
+    `RECOMMENDER_METRICS_PATH` environment variable writes them there
+    (`.json` for JSON, Prometheus text otherwise) when the process exits;
+    a `{pid}` placeholder in the path keeps worker processes apart.
+
+    Setting `RECOMMENDER_PROFILE` to a directory runs every outermost span
+    under `cProfile`, and dumps one `<span>-<pid>-<n>.prof` file per call
+    there, to be read with `pstats` or snakeviz. Spans wrap named
+    functions, so sampling profilers such as py-spy show the same names.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+PROFILE_DIR = os.environ.get('RECOMMENDER_PROFILE')
+METRICS_PATH = os.environ.get('RECOMMENDER_METRICS_PATH')
+
+
+class Metrics:
+    """Thread-safe registry of span timings, counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = collections.Counter()
+        self._gauges = {}
+
+    def record(self, name, seconds, error=False):
+        """Record one call of a span."""
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {'calls': 0, 'errors': 0,
+                                             'seconds_total': 0.0,
+                                             'seconds_max': 0.0}
+            stats['calls'] += 1
+            stats['errors'] += bool(error)
+            stats['seconds_total'] += seconds
+            stats['seconds_max'] = max(stats['seconds_max'], seconds)
+
+    def increment(self, name, value=1):
+        """Add to a counter."""
+        with self._lock:
+            self._counters[name] += value
+
+    def register_gauge(self, name, function):
+        """Expose the number, or dict of numbers, returned by a function."""
+        with self._lock:
+            self._gauges[name] = function
+
+    def reset(self):
+        """Drop recorded spans and counters; gauges are kept."""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Current metrics as a JSON-serialisable dict."""
+        with self._lock:
+            spans = {name: dict(stats) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        values = {}
+        for name, function in gauges.items():
+            value = function()
+            if isinstance(value, dict):
+                values.update(('{}_{}'.format(name, key), v) for key, v in value.items())
+            else:
+                values[name] = value
+        return {'spans': spans, 'counters': counters, 'gauges': values}
+
+
+# Metrics of this process.
+metrics = Metrics()
+
+_state = threading.local()
+_profile_lock = threading.Lock()
+_profile_count = collections.Counter()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time a block of code under a span name.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span, e.g. 'collab_model'.
+
+    """
+    depth = getattr(_state, 'depth', 0)
+    profiler = None
+    if PROFILE_DIR and depth == 0:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    _state.depth = depth + 1
+    error = False
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        metrics.record(name, time.perf_counter() - start, error)
+        _state.depth = depth
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(profiler, name)
+
+
+def _dump_profile(profiler, name):
+    with _profile_lock:
+        _profile_count[name] += 1
+        count = _profile_count[name]
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(
+        PROFILE_DIR, '{}-{}-{}.prof'.format(name, os.getpid(), count)))
+
+
+def timed(name=None):
+    """Decorate a function so each call is recorded as a span.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the span, defaults to the function's name.
+
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1):
+    """Add to a counter of the process metrics."""
+    metrics.increment(name, value)
+
+
+def register_gauge(name, function):
+    """Expose a value computed at export time in the process metrics."""
+    metrics.register_gauge(name, function)
+
+
+def _metric_name(name):
+    return 'recommender_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def to_prometheus(snapshot=None):
+    """Metrics in the Prometheus text exposition format."""
+    snapshot = snapshot or metrics.snapshot()
+    lines = []
+    span_metrics = (('calls', 'counter', 'recommender_span_calls_total'),
+                    ('errors', 'counter', 'recommender_span_errors_total'),
+                    ('seconds_total', 'counter', 'recommender_span_seconds_total'),
+                    ('seconds_max', 'gauge', 'recommender_span_seconds_max'))
+    for field, kind, metric in span_metrics:
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for name, stats in sorted(snapshot['spans'].items()):
+            lines.append('{}{{span="{}"}} {}'.format(metric, name, stats[field]))
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = _metric_name(name) + '_total'
+        lines += ['# TYPE {} counter'.format(metric), '{} {}'.format(metric, value)]
+    for name, value in sorted(snapshot['gauges'].items()):
+        metric = _metric_name(name)
+        lines += ['# TYPE {} gauge'.format(metric), '{} {}'.format(metric, value)]
+    return '\n'.join(lines) + '\n'
+
+
+def to_json(snapshot=None):
+    """Metrics as a JSON document, with a timestamp and process ID."""
+    snapshot = snapshot or metrics.snapshot()
+    return json.dumps(dict(snapshot, time=time.time(), pid=os.getpid()),
+                      sort_keys=True)
+
+
+def write_metrics(path):
+    """Write the metrics to a file, as JSON if it ends in `.json`."""
+    path = path.format(pid=os.getpid())
+    text = to_json() if path.endswith('.json') else to_prometheus()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+if METRICS_PATH:
+    atexit.register(write_metrics, METRICS_PATH)
@@ -0,0 +1,230 @@
+"""
+
+    Lazy, thread-safe loading of shared data and models.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    Data frames, models and similarity indexes are expensive to load, and
+    most app pages never need them. Loaders decorated with `lazy_resource`
+    run on first use only, exactly once per process even when several
+    Streamlit sessions ask for them concurrently. Because the results are
+    held at module level, they survive Streamlit reruns of the app script.
+
+    Long-running processes pick up new data or models with a
+    `ChangeWatcher`, which drops loaded resources once a probe (such as a
+    file signature) changes, so they are reloaded on next use.
+
+    `warm_up` loads every registered resource up front, and can be run as
+    a readiness probe:
+
+        python -m utils.lazy recommenders.content_based recommenders.collaborative_based
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import functools
+import importlib
+import inspect
+import threading
+import time
+from utils.instrumentation import increment, span
+
+# Every lazy resource defined so far, in definition order.
+_registry = []
+# Every memoised loader defined so far.
+_memoized = []
+
+
+class LazyResource:
+    """A value computed on first access and shared afterwards.
+
+    Parameters
+    ----------
+    loader : callable
+        Function without arguments returning the value.
+    name : str, optional
+        Name used when reporting, defaults to the loader's qualified name.
+
+    """
+
+    def __init__(self, loader, name=None):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self.name = name or '{}.{}'.format(loader.__module__, loader.__qualname__)
+        functools.update_wrapper(self, loader)
+
+    def __call__(self):
+        # Double-checked locking: only the first caller pays for the lock.
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    increment('resource_loads')
+                    with span('load.' + self.name):
+                        self._value = self._loader()
+                    self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def reset(self):
+        """Drop the loaded value, so the next access loads it again."""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+
+
+def lazy_resource(loader):
+    """Decorate a loader so its value is loaded once, on first use.
+
+    Parameters
+    ----------
+    loader : callable
+        Function without arguments returning the resource.
+
+    Returns
+    -------
+    LazyResource
+        Callable returning the shared resource.
+
+    """
+    resource = LazyResource(loader)
+    _registry.append(resource)
+    return resource
+
+
+def memoize(loader):
+    """Thread-safe equivalent of `functools.lru_cache` for loaders.
+
+    Concurrent first calls with the same arguments run the loader once;
+    calls with different arguments do not block each other.
+
+    Parameters
+    ----------
+    loader : callable
+        Function whose (hashable) arguments identify the resource.
+
+    Returns
+    -------
+    callable
+        The memoised loader.
+
+    """
+    resources = {}
+    lock = threading.Lock()
+    signature = inspect.signature(loader)
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        # Bind defaults so equivalent calls share one resource.
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.items())
+        resource = resources.get(key)
+        if resource is None:
+            with lock:
+                resource = resources.setdefault(
+                    key, LazyResource(functools.partial(loader, *bound.args,
+                                                        **bound.kwargs),
+                                      name=loader.__qualname__))
+        return resource()
+
+    wrapper.cache_clear = resources.clear
+    _memoized.append(wrapper)
+    return wrapper
+
+
+class ChangeWatcher:
+    """Reset resources when the value of a probe changes.
+
+    Parameters
+    ----------
+    probe : callable
+        Function without arguments whose value identifies the current
+        version of the underlying files, e.g. a file signature.
+    *resets : callable
+        Functions called, in order, when the probe's value changes, e.g.
+        `LazyResource.reset` or a memoised loader's `cache_clear`.
+    interval : float
+        Minimum number of seconds between two probes.
+
+    """
+
+    def __init__(self, probe, *resets, interval=5):
+        self.probe = probe
+        self.resets = resets
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._value = probe()
+        self._checked_at = time.monotonic()
+
+    def sync(self):
+        """Take the probe's current value as the known one, without
+        resetting, e.g. after resetting the resources by hand."""
+        with self._lock:
+            self._value = self.probe()
+            self._checked_at = time.monotonic()
+
+    def check(self):
+        """Reset the resources if the probe changed; True if they were."""
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            value = self.probe()
+            if value == self._value:
+                return False
+            self._value = value
+            for reset in self.resets:
+                reset()
+            return True
+
+
+def reset_all():
+    """Drop every loaded resource and memoised value, so each is loaded
+    again on next use, e.g. after pointing modules at other files."""
+    for loader in list(_memoized):
+        loader.cache_clear()
+    for resource in list(_registry):
+        resource.reset()
+
+
+def warm_up(*modules):
+    """Load lazy resources ahead of the first request.
+
+    Parameters
+    ----------
+    *modules : str
+        Modules to import first, so that their resources are registered.
+
+    Returns
+    -------
+    dict
+        Seconds taken to load each resource, by name.
+
+    """
+    for module in modules:
+        importlib.import_module(module)
+    timings = {}
+    for resource in list(_registry):
+        start = time.time()
+        resource()
+        timings[resource.name] = time.time() - start
+    return timings
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Resources register with the importable module, not with `__main__`.
+    lazy = importlib.import_module('utils.lazy')
+    for name, seconds in lazy.warm_up(*sys.argv[1:]).items():
+        print('{:<60} {:8.3f}s'.format(name, seconds))
@@ -0,0 +1,295 @@
+"""
+
+    Fuzzy and prefix search over movie titles.
+
+    Author: Team_3_CPT.
+
+    Note:
+    ---------------------------------------------------------------------
+    The app cannot ship every catalogue title to the browser, and the
+    recommenders need exact titles. This index lets a few typed letters
+    select any movie, and maps a title written differently from the
+    catalogue ("the matrix", "Les Miserables", "up") to the catalogue title.
+
+    Titles are normalised first: case and accents are folded, the year
+    suffix is dropped, articles MovieLens moves to the end ("Matrix, The",
+    "Haine, La") are removed, as are English articles at the start, and
+    punctuation becomes spaces. Foreign articles are only recognised in
+    the moved form, since at the start of a title they are often English
+    words ("Die Hard", "L.A. Confidential"). A second key keeps the
+    article, moved back to the front ("the matrix", "les miserables"). Two
+    structures are then searched:
+
+    - sorted arrays of both keys, where the titles equal to the query,
+      and those starting with it, each form a contiguous range found by
+      binary search;
+    - an inverted index from character trigrams to the titles containing
+      them, so titles sharing many trigrams with the query (typos, words
+      out of order, words from the middle of a title) score highly.
+
+    Matches are ranked by trigram similarity, with prefix and exact
+    matches first. A query costs a few binary searches and one
+    `bincount` over the postings of its trigrams.
+
+    `resolve`, which the recommenders use, only accepts titles whose
+    normalised form equals the title's. Fuzzy matches are left to the
+    app's search box, where the user picks one explicitly: a close
+    spelling is often another movie ("Samurai" for "Le Samourai"). The
+    trigram postings are only built on the first `search`.
+
+    ---------------------------------------------------------------------
+
+"""
+
+# Script dependencies
+import functools
+import re
+import unicodedata
+import numpy as np
+from utils.catalogue import load_catalogue
+from utils.instrumentation import timed
+
+MOVIES_PATH = 'resources/data/movies.csv'
+
+# Articles MovieLens moves to the end of titles, e.g. "Haine, La".
+ARTICLES = ('the', 'a', 'an', 'la', 'le', 'les', 'l', 'el', 'los', 'las',
+            'il', 'lo', 'der', 'die', 'das', 'den')
+# Articles also dropped from the start of titles and queries.
+LEADING_ARTICLES = ('the', 'a', 'an')
+
+_YEAR = re.compile(r'\s*\(\d{4}(?:\s*-\s*\d{0,4})?\)\s*$')
+_TRAILING_ARTICLE = re.compile(r',\s*(?:{})(?=\s*(?:\(|$))'.format('|'.join(ARTICLES)))
+# The article moved to the end of the main title, before any alternative one
+_MOVED_ARTICLE = re.compile(r'^([^(]*?),\s*({})(?=\s*(?:\(|$))'.format('|'.join(ARTICLES)))
+# Only a separate word is an article; the 'A' of 'A.I.' is not.
+_LEADING_ARTICLE = re.compile(r'^(?:{})\s+'.format('|'.join(LEADING_ARTICLES)))
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalise_title(title, leading_article=False, punctuation=False):
+    """Fold a title or query to the form used for matching.
+
+    Parameters
+    ----------
+    title : str
+        A movie title, e.g. 'Matrix, The (1999)', or a typed query.
+    leading_article : bool
+        Whether to keep an English article at the start, and move an
+        article MovieLens moved to the end back to the front.
+    punctuation : bool
+        Whether to keep punctuation, e.g. to tell 'Up!' from 'Up'.
+
+    Returns
+    -------
+    str
+        Lower-case words separated by single spaces, e.g. 'matrix', or
+        'the matrix' with `leading_article`.
+
+    """
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower()
+    title = _YEAR.sub('', title).strip()
+    if leading_article:
+        title = _MOVED_ARTICLE.sub(r'\2 \1', title, count=1)
+    else:
+        title = _LEADING_ARTICLE.sub('', title)
+    # Also drops articles moved to the end of alternative titles, as in
+    # "City of Lost Children, The (Cité des enfants perdus, La)"
+    title = _TRAILING_ARTICLE.sub('', title)
+    if punctuation:
+        return ' '.join(title.split())
+    return _NON_WORD.sub(' ', title).strip()
+
+
+def trigrams(text):
+    """Distinct character trigrams of a normalised text, padded at the edges."""
+    padded = '  {} '.format(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Prefix and trigram index over distinct movie titles.
+
+    Parameters
+    ----------
+    titles : list (str)
+        Distinct movie titles.
+
+    """
+
+    def __init__(self, titles):
+        self.titles = np.asarray(titles, dtype=object)
+        self.keys = np.array([normalise_title(title) for title in titles],
+                             dtype=object)
+        # Keys keeping their article, at the front
+        self.full_keys = np.array([normalise_title(title, leading_article=True)
+                                   for title in titles], dtype=object)
+        self._lengths = np.array([len(key) for key in self.keys], dtype=np.int32)
+        self._sorted = [self._sort(keys) for keys in (self.keys, self.full_keys)]
+
+    def __len__(self):
+        return len(self.titles)
+
+    @staticmethod
+    def _sort(keys):
+        order = np.argsort(keys.astype(str), kind='stable')
+        return order, keys[order].astype(str)
+
+    @functools.cached_property
+    def _trigrams(self):
+        """Rows of the titles containing each trigram, and the number of
+        trigrams of each title."""
+        postings = {}
+        counts = np.empty(len(self.titles), dtype=np.int32)
+        for row, key in enumerate(self.keys):
+            grams = trigrams(key)
+            counts[row] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        return ({gram: np.array(rows, dtype=np.int32)
+                 for gram, rows in postings.items()}, counts)
+
+    def _key_rows(self, key, full_key, prefix):
+        """Rows whose keys equal, or start with, a key or `full_key`."""
+        rows = []
+        for (order, sorted_keys), query in zip(self._sorted, (key, full_key)):
+            if query:
+                start = np.searchsorted(sorted_keys, query, side='left')
+                if prefix:
+                    stop = np.searchsorted(sorted_keys, query + '\uffff', side='left')
+                else:
+                    stop = np.searchsorted(sorted_keys, query, side='right')
+                rows.append(order[start:stop])
+        return np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def exact_rows(self, key, full_key=None):
+        """Rows whose normalised title equals a normalised query, or
+        whose key with its article equals `full_key`."""
+        return self._key_rows(key, full_key, prefix=False)
+
+    def prefix_rows(self, key, full_key=None):
+        """Rows whose normalised title starts with a normalised query, or
+        whose key with its leading article starts with `full_key`."""
+        return self._key_rows(key, full_key, prefix=True)
+
+    def exact_bonus(self, query, rows):
+        """Preference between the exact matches of a query: 0.5 for the
+        query's year, if it has one, and 0.25 for the same punctuation,
+        so 'up' prefers 'Up (2009)' to 'Up! (1976)'."""
+        bonus = np.zeros(len(rows))
+        year = _YEAR.search(query)
+        key = normalise_title(query, punctuation=True)
+        for i, title in enumerate(self.titles[rows]):
+            if year is not None and title.endswith(year.group().strip()):
+                bonus[i] += 0.5
+            if normalise_title(title, punctuation=True) == key:
+                bonus[i] += 0.25
+        return bonus
+
+    def similarity(self, key):
+        """Dice similarity of the trigram sets of a normalised query and
+        of every title."""
+        postings, counts = self._trigrams
+        grams = trigrams(key)
+        lists = [postings[gram] for gram in grams if gram in postings]
+        if not lists:
+            return np.zeros(len(self.titles))
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.titles))
+        return 2 * shared / (len(grams) + counts)
+
+    def scores(self, query):
+        """Match score of every title for a query.
+
+        Parameters
+        ----------
+        query : str
+            Typed query or title.
+
+        Returns
+        -------
+        np.ndarray (float)
+            Trigram similarity, plus 1 for titles starting with the
+            query, 1 more for exact matches and up to 0.75 more from
+            `exact_bonus`.
+
+        """
+        key = normalise_title(query)
+        full_key = normalise_title(query, leading_article=True)
+        if not key:
+            return np.zeros(len(self.titles))
+        scores = self.similarity(key)
+        scores[self.prefix_rows(key, full_key)] += 1
+        exact = self.exact_rows(key, full_key)
+        scores[exact] += 1 + self.exact_bonus(query, exact)
+        return scores
+
+    def _ranked(self, scores):
+        """Rows of the matching titles, best first, shorter first on ties."""
+        candidates = np.flatnonzero(scores > 0)
+        order = np.lexsort((candidates, self._lengths[candidates],
+                            -scores[candidates]))
+        return candidates[order]
+
+    @timed('title_search')
+    def search(self, query, limit=10):
+        """Best matching titles for a query.
+
+        Parameters
+        ----------
+        query : str
+            Typed query, e.g. 'godfath' or 'matrix reloded'.
+        limit : int
+            Maximum number of titles returned.
+
+        Returns
+        -------
+        list (str)
+            Matching titles, best first. Ties go to the shorter title.
+
+        """
+        return self.titles[self._ranked(self.scores(query))[:limit]].tolist()
+
+    def resolve(self, title):
+        """The catalogue title a title refers to.
+
+        Only titles equal to it once normalised match, e.g. 'Matrix, The
+        (1999)' for 'the matrix'. Of several matches, the one of the
+        title's year is preferred, then the one of the same punctuation,
+        then the shorter, then the first in the catalogue.
+
+        Parameters
+        ----------
+        title : str
+            A title as typed or stored elsewhere.
+
+        Returns
+        -------
+        str
+            The matching catalogue title.
+
+        Raises
+        ------
+        KeyError
+            If no title matches.
+
+        """
+        key = normalise_title(title)
+        full_key = normalise_title(title, leading_article=True)
+        if not key and not full_key:
+            raise KeyError(title)
+        rows = self.exact_rows(key, full_key)
+        if not len(rows):
+            raise KeyError(title)
+        order = np.lexsort((rows, self._lengths[rows],
+                            -self.exact_bonus(title, rows)))
+        return self.titles[rows[order[0]]]
+
+
+def load_title_index(path_to_movies=MOVIES_PATH):
+    """Title index of the movie catalogue, built once per catalogue.
+
+    The recommenders build it with their other resources, ahead of the
+    first request, see `get_title_index` in each of them.
+
+    """
+    return load_catalogue(path_to_movies).title_index